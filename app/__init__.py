@@ -6,5 +6,5 @@ app = Flask(__name__)
 app.config.from_object(Config)
 app.config['SECRET_KEY'] = 'your-secret-key'
 
-from app.ontology import onto
-from app import routes
+from app.ontology import store
+from app import routes, api
@@ -0,0 +1,299 @@
+# app/api.py
+"""Read-only JSON API, versioned under /api/v1.
+
+Every GET (or HEAD) response depends only on the loaded store and the
+request URL, so each carries a strong ETag derived from the store version. A
+matching If-None-Match is answered with 304 before the view runs at all, and
+Cache-Control lets a reverse proxy serve repeat requests itself. Note that
+the ETag is the same for every URL and the resource is never looked up for a
+304: a client that sends the current ETag for an unknown guidid or category
+gets 304 rather than 404. It can only have that ETag from an earlier 200, and
+nothing has changed since. The toolkit planner also accepts a POST body, for
+batches too long for a URL; those responses are not cached.
+"""
+import hashlib
+from functools import wraps
+from flask import request, jsonify, url_for
+from app import app
+from app.ontology import store
+from app.cache import cached
+from app.helper import SEARCH_FACETS, get_facet_index, get_search_matches, get_category_procedures, find_category, get_all_subcategories, get_top_categories, get_subcategories, paginate, paginate_matches, get_procedure_detail, get_report_rows, get_toolkit_plan
+from app.search import get_search_index
+from app.suggest import suggest, SUGGEST_KINDS
+
+API_PREFIX = '/api/v1'
+# Part of every ETag; bump when the shape of a response changes
+API_REVISION = 4
+
+def api_etag():
+    """Strong validator for the data currently being served."""
+    version = f"{API_REVISION}:{store.version}:{store.hazard_lexicon}"
+    return hashlib.sha1(version.encode()).hexdigest()
+
+def conditional(view):
+    """Answer If-None-Match from the ETag alone and add caching headers to responses."""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        if request.method not in ('GET', 'HEAD'):
+            return view(*args, **kwargs)
+        etag = api_etag()
+        if request.if_none_match.contains(etag):
+            response = app.response_class(status=304)
+        else:
+            response = view(*args, **kwargs)
+            if response.status_code != 200:
+                return response
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config['API_CACHE_MAX_AGE']
+        return response
+    return wrapper
+
+def page_args():
+    per_page = request.args.get('per_page', app.config['SEARCH_RESULTS_PER_PAGE'], type=int)
+    return request.args.get('page', 1, type=int), min(max(per_page, 1), app.config['API_MAX_PER_PAGE'])
+
+def not_found(message):
+    response = jsonify(error=message)
+    response.status_code = 404
+    return response
+
+def bad_request(message):
+    response = jsonify(error=message)
+    response.status_code = 400
+    return response
+
+def record_json(record):
+    return {'title': record.title, 'url': getattr(record, 'url', None)}
+
+def procedure_json(procedure):
+    """Summary of a procedure, as listed in search results and category guides."""
+    return {
+        'guidid': procedure.guidid,
+        'title': procedure.title,
+        'url': procedure.url,
+        'image': procedure.image,
+        'item': store.items[procedure.item].title if procedure.item is not None else None,
+        'href': url_for('api_procedure', guidid=procedure.guidid),
+    }
+
+def page_json(pagination):
+    return {
+        'page': pagination['page'],
+        'pages': pagination['pages'],
+        'total': pagination['total'],
+        'procedures': [procedure_json(procedure) for procedure in pagination['items']],
+    }
+
+@app.route(f'{API_PREFIX}/procedures')
+@conditional
+def api_procedures():
+    page, per_page = page_args()
+    return jsonify(page_json(paginate(store.procedures, page, per_page)))
+
+@app.route(f'{API_PREFIX}/procedures/<int:guidid>')
+@conditional
+def api_procedure(guidid):
+    detail = get_procedure_detail(guidid)
+    if not detail:
+        return not_found(f"Procedure with guidid '{guidid}' not found.")
+
+    procedure = detail['procedure']
+    return jsonify(dict(
+        procedure_json(procedure),
+        description=procedure.description,
+        category=detail['category'].title if detail['category'] else None,
+        tools=[record_json(tool) for tool in detail['tools']],
+        missing_tools=[record_json(tool) for tool in detail['missing_tools']],
+        subprocedures=[procedure_json(subprocedure) for subprocedure in detail['subprocedures']],
+        similar=[dict(procedure_json(other), similarity=round(score, 4)) for other, score in detail['similar']],
+        steps=[
+            {
+                'number': step['number'],
+                'description': step['description'],
+                'actions': list(step['actions']),
+                'parts': [part.title for part in step['parts']],
+                'tools': [record_json(tool) for tool in step['tools']],
+                'images': list(step['images']),
+                'hazards': list(step['hazards']),
+            }
+            for step in detail['steps']
+        ],
+    ))
+
+def build_category_tree():
+    """The category hierarchy with procedure counts, as nested JSON-ready dicts."""
+    counts = get_facet_index()['category_counts']
+
+    def subtree(category, seen):
+        return {
+            'title': category.title,
+            'count': counts.get(category.title, 0),
+            'href': url_for('api_category', category_title=category.title),
+            'subcategories': [
+                subtree(child, seen | {child}) for child in get_subcategories(category)
+                if child.title and child not in seen
+            ],
+        }
+    return [subtree(category, {category}) for category in get_top_categories() if category.title]
+
+@app.route(f'{API_PREFIX}/categories')
+@conditional
+def api_categories():
+    return jsonify(categories=cached('api_category_tree', build_category_tree))
+
+@app.route(f'{API_PREFIX}/categories/<category_title>')
+@conditional
+def api_category(category_title):
+    category = find_category(category_title)
+    if not category:
+        return not_found(f"Category with title '{category_title}' not found.")
+
+    page, per_page = page_args()
+    procedures = get_category_procedures(get_all_subcategories(category) | {category})
+    return jsonify(dict(
+        page_json(paginate(procedures, page, per_page)),
+        title=category.title,
+        subcategories=[child.title for child in get_subcategories(category) if child.title],
+    ))
+
+def search_args():
+    """Query and facet selection from the query string, in the form get_search_matches takes."""
+    choice_values = get_facet_index()['choice_values']
+    params = {'query': request.args.get('q', '').lower().strip()}
+    for facet in SEARCH_FACETS:
+        params[facet] = sorted(set(request.args.getlist(facet)) & choice_values[facet])
+    return params
+
+@app.route(f'{API_PREFIX}/search')
+@conditional
+def api_search():
+    params = search_args()
+    page, per_page = page_args()
+    return jsonify(dict(page_json(paginate_matches(get_search_matches(params), page, per_page, params['query'])), query=params['query']))
+
+@app.route(f'{API_PREFIX}/facets')
+@conditional
+def api_facets():
+    """Facet counts, narrowed to a search when one is given."""
+    if request.args:
+        matched = get_search_matches(search_args())
+        category_counts, tool_counts, part_counts, hazard_counts = get_search_index().facet_counts(matched)
+    else:
+        facets = get_facet_index()
+        category_counts, tool_counts, part_counts, hazard_counts = (
+            facets['category_counts'], facets['tool_counts'], facets['part_counts'], facets['hazard_counts']
+        )
+    return jsonify(
+        categories=category_counts,
+        tools=tool_counts,
+        parts=part_counts,
+        hazards=hazard_counts,
+    )
+
+@app.route(f'{API_PREFIX}/reports')
+@conditional
+def api_reports():
+    rows = get_report_rows(
+        request.args.get('min_steps', 6, type=int),
+        request.args.get('min_procedures', 10, type=int),
+        min(max(request.args.get('limit', app.config['REPORT_ROWS'], type=int), 0), app.config['API_MAX_PER_PAGE']),
+    )
+    return jsonify(
+        min_steps=rows['min_steps'],
+        min_procedures=rows['min_procedures'],
+        step_counts={
+            'total': rows['step_counts_total'],
+            'rows': [dict(procedure_json(procedure), steps=count) for count, procedure in rows['step_counts']],
+        },
+        procedure_counts={
+            'total': rows['procedure_counts_total'],
+            'rows': [dict(record_json(item), procedures=count) for count, item in rows['procedure_counts']],
+        },
+        unused_tools={
+            'total': rows['unused_tools_total'],
+            'rows': [dict(procedure_json(procedure), tools=[record_json(tool) for tool in tools]) for procedure, tools in rows['unused_tools']],
+        },
+        hazard_steps={
+            'total': rows['hazard_steps_total'],
+            'rows': [
+                dict(procedure_json(procedure), steps=[{'number': number, 'hazards': list(step.hazards)} for number, step in steps])
+                for procedure, steps in rows['hazard_steps']
+            ],
+        },
+    )
+
+def integer_arg(value):
+    """A JSON integer, or a query string value of digits, as an int.
+
+    int() alone would also turn 1.9 and true into 1, so other types raise TypeError.
+    """
+    if isinstance(value, str):
+        if not value.strip().lstrip('-').isdecimal():
+            raise ValueError(f"not an integer: {value!r}")
+    elif isinstance(value, bool) or not isinstance(value, int):
+        raise TypeError(f"not an integer: {value!r}")
+    return int(value)
+
+def toolkit_args():
+    """Guidids and tool limit from a JSON body ({"guidids": [...], "max_tools": n}) or the query
+    string (guidids=1,2,3&max_tools=n). Raises ValueError or TypeError if the input has another shape."""
+    if request.method == 'POST':
+        body = request.get_json(silent=True) or {}
+        if not isinstance(body, dict):
+            raise ValueError("the body must be a JSON object")
+        guidids, max_tools = body.get('guidids', []), body.get('max_tools')
+    else:
+        guidids = [guidid for value in request.args.getlist('guidids') for guidid in value.split(',') if guidid.strip()]
+        max_tools = request.args.get('max_tools')
+    if not isinstance(guidids, list):
+        raise ValueError("'guidids' must be a list")
+    return [integer_arg(guidid) for guidid in guidids], None if max_tools is None else max(integer_arg(max_tools), 0)
+
+@app.route(f'{API_PREFIX}/toolkit', methods=['GET', 'POST'])
+@conditional
+def api_toolkit():
+    try:
+        guidids, max_tools = toolkit_args()
+    except (TypeError, ValueError):
+        return bad_request("Expected a JSON object (or query string) with a list of integer 'guidids' and an optional integer 'max_tools'.")
+
+    plan = get_toolkit_plan(guidids, max_tools)
+    kit_size = 0
+    steps = []
+    for tools, completed in plan['steps']:
+        kit_size += len(tools)
+        steps.append({
+            'add_tools': [record_json(tool) for tool in tools],
+            'completes': [procedure_json(procedure) for procedure in completed],
+            'kit_size': kit_size,
+        })
+    return jsonify(
+        procedures=plan['procedures'],
+        unknown=plan['unknown'],
+        toolkit=[dict(record_json(tool), procedures=count) for tool, count in plan['toolkit']],
+        plan=steps,
+        incomplete=[procedure_json(procedure) for procedure in plan['incomplete']],
+    )
+
+# /api/suggest is the original, unversioned path, kept for existing clients.
+# The versioned rule is registered first, so url_for builds it.
+@app.route('/api/suggest')
+@app.route(f'{API_PREFIX}/suggest')
+@conditional
+def suggest_api():
+    query = request.args.get('q', '')
+    kinds = request.args.getlist('kind') or SUGGEST_KINDS
+    limit = request.args.get('limit', app.config['SUGGEST_LIMIT'], type=int)
+
+    links = {
+        'procedure': lambda ref: url_for('procedure_detail', guidid=ref),
+        'category': lambda ref: url_for('category_detail', category_title=ref),
+        'tool': lambda ref: url_for('search_results', tools=ref),
+        'part': lambda ref: url_for('search_results', parts=ref),
+    }
+    suggestions = [
+        {'kind': kind, 'title': title, 'count': count, 'url': links[kind](ref)}
+        for kind, title, count, ref in suggest(query, kinds, limit)
+    ]
+    return jsonify(query=query, suggestions=suggestions)
@@ -0,0 +1,10 @@
+from app.ontology import snapshot
+
+def cached(name, builder):
+    """Return the index stored under `name` for the data this request is using,
+    calling `builder` to build it the first time it is used.
+
+    Indexes live on their Snapshot, so a reload starts from fresh ones (see
+    app.ontology.reload) and old ones go away with the old data.
+    """
+    return snapshot().index(name, builder)
@@ -1,11 +1,33 @@
 # app/forms.py
 from flask_wtf import FlaskForm
-from wtforms import StringField, SelectMultipleField, SubmitField
+from wtforms import StringField, SelectMultipleField, SubmitField, ValidationError
 from wtforms.validators import Optional
+from app.helper import get_facet_index
+
+class FacetField(SelectMultipleField):
+    """Multiple select over one facet, validated against the cached set of its values
+    instead of a scan of the choice list."""
+
+    def pre_validate(self, form):
+        if self.data:
+            values = get_facet_index()['choice_values'][self.name]
+            invalid = [value for value in self.data if value not in values]
+            if invalid:
+                raise ValidationError(f"Not a valid choice: {', '.join(invalid)}")
 
 class SearchForm(FlaskForm):
     query = StringField('Query', validators=[Optional()])
-    categories = SelectMultipleField('Categories', choices=[], coerce=str, validators=[Optional()], default=[])
-    tools = SelectMultipleField('Tools', choices=[], coerce=str, validators=[Optional()], default=[])
-    parts = SelectMultipleField('Parts', choices=[], coerce=str, validators=[Optional()], default=[])
+    categories = FacetField('Categories', choices=[], coerce=str, validators=[Optional()], default=[])
+    tools = FacetField('Tools', choices=[], coerce=str, validators=[Optional()], default=[])
+    parts = FacetField('Parts', choices=[], coerce=str, validators=[Optional()], default=[])
+    hazards = FacetField('Hazards', choices=[], coerce=str, validators=[Optional()], default=[])
     submit = SubmitField('Apply Filters')
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Shared, precomputed choice lists; nothing is rebuilt per form
+        facets = get_facet_index()
+        self.categories.choices = facets['category_choices']
+        self.tools.choices = facets['tool_choices']
+        self.parts.choices = facets['part_choices']
+        self.hazards.choices = facets['hazard_choices']
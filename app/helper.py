@@ -1,142 +1,429 @@
-from app.ontology import onto
+from functools import lru_cache
+from itertools import islice
+from flask import render_template
+from markupsafe import Markup
+from app import app
+from app.ontology import store
+from app.cache import cached
+from app.search import get_search_index, popcount
+from ontology.toolkit import plan_toolkit
 
-def populate_facet_choices(form=None):
+def build_facet_index():
     # initialise counts
     category_counts = {}
     tool_counts = {}
     part_counts = {}
-
-    # Build a mapping of category titles to category instances
-    categories_by_title = {cat.title: cat for cat in onto.DeviceCategory.instances() if cat.title}
+    hazard_counts = {}
 
     # Build category hierarchy and initialise counts
-    category_hierarchy = build_category_hierarchy(categories_by_title)
+    category_hierarchy = build_category_hierarchy()
 
     # Calculate counts
-    for procedure in onto.Procedure.instances():
+    for procedure in store.procedures:
         # Categories
-        item = procedure.part_of[0] if procedure.part_of else None
-        if item and item.belongs_to_category:
-            for category in item.belongs_to_category:
+        item = store.items[procedure.item] if procedure.item is not None else None
+        if item and item.categories:
+            for category_id in item.categories:
                 # Increment counts for the category and all its ancestors
-                propagate_category_count(category, category_counts)
+                propagate_category_count(store.categories[category_id], category_counts)
         # Tools
-        for tool in procedure.uses_tool:
-            tool_title = tool.title
+        for tool_id in procedure.tools:
+            tool_title = store.tools[tool_id].title
             tool_counts[tool_title] = tool_counts.get(tool_title, 0) + 1
         # Parts
-        parts_in_procedure = set(part for step in procedure.consists_of for part in step.involves_part)
-        for part in parts_in_procedure:
-            part_title = part.title
+        parts_in_procedure = set(part_id for step_id in procedure.steps for part_id in store.steps[step_id].parts)
+        for part_id in parts_in_procedure:
+            part_title = store.parts[part_id].title
             part_counts[part_title] = part_counts.get(part_title, 0) + 1
+        # Hazards
+        hazards_in_procedure = set(tag for step_id in procedure.steps for tag in store.steps[step_id].hazards)
+        for tag in hazards_in_procedure:
+            hazard_counts[tag] = hazard_counts.get(tag, 0) + 1
 
-    if form:
-        # Populate categories with counts
-        form.categories.choices = [
+    return {
+        'category_hierarchy': category_hierarchy,
+        'category_counts': category_counts,
+        'tool_counts': tool_counts,
+        'part_counts': part_counts,
+        'hazard_counts': hazard_counts,
+        # Form choices with counts
+        'category_choices': [
             (cat.title, f"{cat.title} ({category_counts.get(cat.title, 0)})")
-            for cat in onto.DeviceCategory.instances() if cat.title
-        ]
-
-        # Populate tools with counts
-        form.tools.choices = [
+            for cat in store.categories if cat.title
+        ],
+        'tool_choices': [
             (tool.title, f"{tool.title} ({tool_counts.get(tool.title, 0)})")
-            for tool in onto.Tool.instances() if tool.title
-        ]
-
-        # Populate parts with counts
-        form.parts.choices = [
+            for tool in store.tools if tool.title
+        ],
+        'part_choices': [
             (part.title, f"{part.title} ({part_counts.get(part.title, 0)})")
-            for part in onto.Part.instances() if part.title
-        ]
+            for part in store.parts if part.title
+        ],
+        'hazard_choices': [
+            (tag, f"{tag} ({count})") for tag, count in sorted(hazard_counts.items())
+        ],
+        # Valid values of each SearchForm facet field, for membership checks
+        'choice_values': {
+            'categories': frozenset(cat.title for cat in store.categories if cat.title),
+            'tools': frozenset(tool.title for tool in store.tools if tool.title),
+            'parts': frozenset(part.title for part in store.parts if part.title),
+            'hazards': frozenset(hazard_counts),
+        },
+    }
+
+def get_facet_index():
+    """Facet counts, form choices and category hierarchy, built once per ontology version."""
+    return cached('facets', build_facet_index)
+
+def populate_facet_choices(form=None):
+    """Sidebar hierarchy and counts. SearchForm fills in its own choices, so `form` is optional."""
+    facets = get_facet_index()
+
+    if form:
+        form.categories.choices = facets['category_choices']
+        form.tools.choices = facets['tool_choices']
+        form.parts.choices = facets['part_choices']
+        form.hazards.choices = facets['hazard_choices']
+
+    return facets['category_hierarchy'], facets['category_counts']
+
+def populate_drilldown_choices(form, matched):
+    """Relabel the form choices with counts restricted to the `matched` procedure bitset.
+
+    Returns the matching category counts for the sidebar category tree.
+    """
+    facets = get_facet_index()
+    category_counts, tool_counts, part_counts, hazard_counts = get_search_index().facet_counts(matched)
+
+    form.categories.choices = [
+        (title, f"{title} ({category_counts.get(title, 0)})") for title, _ in facets['category_choices']
+    ]
+    form.tools.choices = [
+        (title, f"{title} ({tool_counts.get(title, 0)})") for title, _ in facets['tool_choices']
+    ]
+    form.parts.choices = [
+        (title, f"{title} ({part_counts.get(title, 0)})") for title, _ in facets['part_choices']
+    ]
+    form.hazards.choices = [
+        (tag, f"{tag} ({hazard_counts.get(tag, 0)})") for tag, _ in facets['hazard_choices']
+    ]
 
-    return category_hierarchy, category_counts
+    return category_counts
 
 def propagate_category_count(category, category_counts):
     # Increment count for the category
     category_counts[category.title] = category_counts.get(category.title, 0) + 1
     # Recursively increment counts for parent categories
-    for parent in category.subcategory_of:
-        propagate_category_count(parent, category_counts)
+    for parent_id in category.parents:
+        propagate_category_count(store.categories[parent_id], category_counts)
 
-def build_category_hierarchy(categories_by_title):
+def build_category_index():
+    """Lowercase title lookup, parent -> children adjacency and descendant sets for all categories."""
+    categories = store.categories
+    by_title = {}
+    children = {}
+    roots = []
+    for category in categories:
+        if category.title:
+            by_title.setdefault(category.title.lower(), category)
+        if not category.parents:
+            roots.append(category)
+        children[category] = [categories[child_id] for child_id in category.children]
+
+    descendants = {}
+    def collect(category):
+        if category not in descendants:
+            descendants[category] = frozenset()  # guards against cycles
+            found = set()
+            for child in children.get(category, ()):
+                found.add(child)
+                found |= collect(child)
+            descendants[category] = frozenset(found)
+        return descendants[category]
+    for category in categories:
+        collect(category)
+
+    return {'by_title': by_title, 'children': children, 'descendants': descendants, 'roots': roots}
+
+def get_category_index():
+    return cached('categories', build_category_index)
+
+def find_category(title):
+    """Case-insensitive category lookup by title."""
+    return get_category_index()['by_title'].get(title.lower())
+
+def get_subcategories(category):
+    """Direct subcategories of a category."""
+    return get_category_index()['children'].get(category, [])
+
+def get_top_categories():
+    return get_category_index()['roots']
+
+def build_category_hierarchy():
     # Find all top-level categories (categories without parents)
     hierarchy = {}
-    for category in categories_by_title.values():
-        if not category.subcategory_of:
-            hierarchy[category.title] = build_subtree(category, categories_by_title)
+    for category in get_top_categories():
+        if category.title:
+            hierarchy[category.title] = build_subtree(category)
     return hierarchy
 
-def build_subtree(category, categories_by_title):
+def build_subtree(category):
     subtree = {'category': category, 'subcategories': {}}
-    for subcategory in categories_by_title.values():
-        if category in subcategory.subcategory_of:
-            subtree['subcategories'][subcategory.title] = build_subtree(subcategory, categories_by_title)
+    for subcategory in get_subcategories(category):
+        if subcategory.title:
+            subtree['subcategories'][subcategory.title] = build_subtree(subcategory)
     return subtree
 
 
+def render_category_tree():
+    """Sidebar category tree HTML, rendered once per ontology version.
+
+    Nothing is checked and counts cover every procedure; see category_tree_state.
+    """
+    def render():
+        facets = get_facet_index()
+        return Markup(render_template(
+            'category_tree.html',
+            category_hierarchy=facets['category_hierarchy'],
+            category_counts=facets['category_counts'],
+        ))
+    return cached('category_tree_html', render)
+
+def category_tree_state(selected_categories, category_counts=None):
+    """Checkbox state and counts for the sidebar to apply to the cached tree.
+
+    Only non-zero counts are sent; None keeps the counts the tree was rendered with.
+    """
+    return {
+        'selected': list(selected_categories),
+        'counts': None if category_counts is None else {title: count for title, count in category_counts.items() if count},
+    }
+
 def get_all_subcategories(category):
-    """Recursively get all subcategories of a given category."""
-    subcategories = set()
-    to_visit = [category]
-
-    while to_visit:
-        current = to_visit.pop()
-        for subcat in onto.DeviceCategory.instances():
-            if current in subcat.subcategory_of and subcat not in subcategories:
-                subcategories.add(subcat)
-                to_visit.append(subcat)
-    return subcategories
+    """All subcategories of a given category, at any depth."""
+    return get_category_index()['descendants'].get(category, frozenset())
 
 def select_all_selected_category_titles(selected_categories):
     all_selected_category_titles = set()
     if selected_categories:
         for cat_title in selected_categories:
-            category = onto.search_one(title=cat_title)
+            category = find_category(cat_title)
             if category:
                 # Add the selected category itself
                 all_selected_category_titles.add(category.title.lower())
                 # Add its subcategories
                 subcategories = get_all_subcategories(category)
                 for subcat in subcategories:
-                    all_selected_category_titles.add(subcat.title.lower())
+                    if subcat.title:
+                        all_selected_category_titles.add(subcat.title.lower())
             else:
                 app.logger.warning(f"Category with title '{cat_title}' not found.")
     return all_selected_category_titles
 
 
-def find_all_matching_procedures(query, selected_categories, selected_tools, selected_parts):
-    matching_procedures = []
-    all_selected_category_titles = set(selected_categories)
-    # Find all procedures that match the query and selected facets
+def build_guide_index():
+    """Category -> procedures of the items filed directly under it, in store order."""
+    procedures_by_item = {}
+    for procedure in store.procedures:
+        if procedure.item is not None:
+            procedures_by_item.setdefault(procedure.item, []).append(procedure)
+
+    procedures_by_category = {}
+    for item in store.items:
+        for category_id in set(item.categories):
+            procedures_by_category.setdefault(store.categories[category_id], []).extend(procedures_by_item.get(item.id, []))
+    for procedures in procedures_by_category.values():
+        procedures.sort(key=lambda procedure: procedure.id)
+
+    return {'procedures_by_category': procedures_by_category}
 
-    for procedure in onto.Procedure.instances():
-        # Filter by query
-        if query and (not procedure.title or query not in procedure.title.lower()):
-            continue
-
-        # Filter by categories
-        if selected_categories:
-            item = procedure.part_of[0] if procedure.part_of else None
-            if not item or not item.belongs_to_category:
-                continue
-
-            item_category_titles = {category.title.lower() for category in item.belongs_to_category}
-            if not item_category_titles.intersection(all_selected_category_titles):
-                continue
-
-        # Filter by tools
-        if selected_tools:
-            procedure_tool_titles = set(tool.title for tool in procedure.uses_tool)
-            if not set(selected_tools).issubset(procedure_tool_titles):
-                continue
-
-        # Filter by parts
-        if selected_parts:
-            # Extract parts involved in each step of the procedure
-            parts_in_procedure = set(part.title for step in procedure.consists_of for part in step.involves_part)
-            if not set(selected_parts).issubset(parts_in_procedure):
-                continue
-
-        matching_procedures.append(procedure)
-    
-    return matching_procedures
\ No newline at end of file
+def get_guide_index():
+    return cached('guides', build_guide_index)
+
+def get_category_procedures(categories):
+    """Procedures whose item belongs to any of `categories`."""
+    guides = get_guide_index()
+    lists = [guides['procedures_by_category'].get(category, []) for category in categories]
+    lists = [procedures for procedures in lists if procedures]
+    if len(lists) == 1:
+        return lists[0]
+    merged = {procedure for procedures in lists for procedure in procedures}
+    return sorted(merged, key=lambda procedure: procedure.id)
+
+SEARCH_FACETS = ('categories', 'tools', 'parts', 'hazards')
+
+def search_params(form):
+    """The query and facet selection of a bound SearchForm, as /search_results GET parameters.
+
+    Values that are not valid choices are dropped, and each selection is
+    deduplicated and sorted, so equal searches share one URL and one cache entry.
+    """
+    choice_values = get_facet_index()['choice_values']
+    params = {'query': form.query.data.lower().strip() if form.query.data else ''}
+    for facet in SEARCH_FACETS:
+        params[facet] = sorted(set(getattr(form, facet).data or ()) & choice_values[facet])
+    return params
+
+def match_search(query, categories, tools, parts, hazards):
+    return get_search_index().match(query, select_all_selected_category_titles(categories), tools, parts, hazards)
+
+def get_search_matches(params):
+    """Result bitset for `search_params`, kept in a size-limited LRU per ontology version."""
+    matches = cached('search_matches', lambda: lru_cache(maxsize=app.config['SEARCH_MATCH_CACHE_SIZE'])(match_search))
+    return matches(params['query'], *(tuple(params[facet]) for facet in SEARCH_FACETS))
+
+def rank_matches(query, matched):
+    return get_search_index().ranking(query, matched)
+
+def get_search_ranking(query, matched):
+    """Ranked ordinals of a search result bitset, kept in a size-limited LRU per ontology version.
+
+    Every page of a search is cut from the same ranking, so the matches are scored once.
+    """
+    rankings = cached('search_rankings', lambda: lru_cache(maxsize=app.config['SEARCH_RANKING_CACHE_SIZE'])(rank_matches))
+    return rankings(query, matched)
+
+def page_window(total, page, per_page):
+    """Clamp a 1-based page number and return (page, pages, start offset)."""
+    pages = max(1, -(-total // per_page))
+    page = min(max(page, 1), pages)
+    return page, pages, (page - 1) * per_page
+
+def paginate(sequence, page, per_page):
+    """Slice one page out of `sequence`; pages are numbered from 1."""
+    page, pages, start = page_window(len(sequence), page, per_page)
+    return {
+        'items': sequence[start:start + per_page],
+        'page': page,
+        'pages': pages,
+        'total': len(sequence),
+    }
+
+def paginate_matches(matched, page, per_page, query=''):
+    """One page of display records for a search result bitset.
+
+    The total comes from a popcount; only the records on the page are looked up.
+    With a text query the page is cut from the cached BM25 ranking of the matches.
+    """
+    search_index = get_search_index()
+    total = popcount(matched)
+    page, pages, start = page_window(total, page, per_page)
+    if query:
+        ordinals = get_search_ranking(query, matched)[start:start + per_page]
+    else:
+        ordinals = search_index.ordinals_slice(matched, start, per_page)
+    return {
+        'items': search_index.display_records(ordinals),
+        'page': page,
+        'pages': pages,
+        'total': total,
+    }
+
+def step_view(step):
+    """A step with its tool and part ids resolved to records, for templates."""
+    return {
+        'description': step.description,
+        'actions': step.actions,
+        'parts': [store.parts[part_id] for part_id in step.parts],
+        'tools': [store.tools[tool_id] for tool_id in step.tools],
+        'images': step.images,
+        'hazards': step.hazards,
+    }
+
+def build_procedure_detail(guidid):
+    """Everything procedure_detail.html shows for one procedure, or None if there is no such guide."""
+    procedure = store.procedure(guidid)
+    if not procedure:
+        return None
+
+    # Gather data (the store keeps steps sorted by order)
+    steps = [step_view(store.steps[step_id]) for step_id in procedure.steps]
+    for number, step in enumerate(steps, 1):
+        step['number'] = number
+
+    # Tools used in steps but missing from the procedure's toolbox, materialized with the store
+    missing_tools = [store.tools[tool_id] for tool_id in store.reports.missing_tools.get(procedure.id, ())]
+
+    # Steps tagged by the hazard lexicon when the store was built
+    hazard_steps = [step for step in steps if step['hazards']]
+
+    # Retrieve the associated category via the item the procedure is part of
+    item = store.items[procedure.item] if procedure.item is not None else None
+    if item and item.categories:
+        category = store.categories[item.categories[0]]  # Assuming single category
+    else:
+        category = None  # Handle cases where category is not found
+        app.logger.warning(f"Procedure '{procedure.title}' is not linked to any category.")
+
+    return {
+        'procedure': procedure,
+        'steps': steps,
+        'tools': [store.tools[tool_id] for tool_id in procedure.tools],
+        'subprocedures': [store.procedures[procedure_id] for procedure_id in procedure.subprocedures],
+        'missing_tools': missing_tools,
+        'hazard_steps': hazard_steps,
+        'category': category,
+        # (procedure, Jaccard index) pairs found by MinHash/LSH when the store was built
+        'similar': [(store.procedures[other], score) for other, score in store.similar.get(procedure.id, ())],
+    }
+
+def get_procedure_detail(guidid):
+    """Detail record for a guide, kept in a size-limited LRU per ontology version."""
+    details = cached('procedure_details', lambda: lru_cache(maxsize=app.config['PROCEDURE_DETAIL_CACHE_SIZE'])(build_procedure_detail))
+    return details(guidid)
+
+def get_report_rows(min_steps, min_procedures, limit):
+    """The report tables materialized with the store, resolved to records.
+
+    Each list is cut to its first `limit` rows; the `*_total` entries give the full sizes.
+    """
+    reports = store.reports
+    many_steps = reports.procedures_with_more_steps(min_steps)
+    many_procedures = reports.items_with_more_procedures(min_procedures)
+    return {
+        'min_steps': min_steps,
+        'min_procedures': min_procedures,
+        'step_counts': [(count, store.procedures[procedure_id]) for count, procedure_id in many_steps[:limit]],
+        'step_counts_total': len(many_steps),
+        'procedure_counts': [(count, store.items[item_id]) for count, item_id in many_procedures[:limit]],
+        'procedure_counts_total': len(many_procedures),
+        'unused_tools': [
+            (store.procedures[procedure_id], [store.tools[tool_id] for tool_id in tool_ids])
+            for procedure_id, tool_ids in islice(reports.unused_tools.items(), limit)
+        ],
+        'unused_tools_total': len(reports.unused_tools),
+        'hazard_steps': [
+            (store.procedures[procedure_id], [(number, store.steps[step_id]) for number, step_id in steps])
+            for procedure_id, steps in islice(reports.hazard_steps.items(), limit)
+        ],
+        'hazard_steps_total': len(reports.hazard_steps),
+    }
+
+def get_toolkit_plan(guidids, max_tools=None):
+    """Union toolkit and packing plan for a batch of guides, resolved to records.
+
+    Guidids that are not in the store are returned under 'unknown'.
+    """
+    procedure_ids, unknown = [], []
+    for guidid in guidids:
+        procedure_id = store.by_guidid.get(guidid)
+        if procedure_id is None:
+            unknown.append(guidid)
+        else:
+            procedure_ids.append(procedure_id)
+
+    plan = plan_toolkit(store.tool_bits, procedure_ids, max_tools)
+    return {
+        'procedures': len(set(procedure_ids)),
+        'unknown': unknown,
+        'toolkit': [(store.tools[tool_id], count) for tool_id, count in plan['toolkit']],
+        'steps': [
+            ([store.tools[tool_id] for tool_id in tool_ids], [store.procedures[procedure_id] for procedure_id in completed])
+            for tool_ids, completed in plan['steps']
+        ],
+        'incomplete': [store.procedures[procedure_id] for procedure_id in plan['incomplete']],
+    }
+
+def find_all_matching_procedures(query, selected_categories, selected_tools, selected_parts, selected_hazards=()):
+    # Find all procedures that match the query and selected facets
+    return get_search_index().search(query, selected_categories, selected_tools, selected_parts, selected_hazards)
@@ -1,10 +1,141 @@
-# app/ontology.py
-from owlready2 import get_ontology, sync_reasoner
+import os
+import threading
+import time
+from flask import g, has_app_context
+from werkzeug.local import LocalProxy
+from ontology.snapshot import load_store, load_fulltext, read_exports, meta_path
+from ontology.store import store_path_for
 
 ontology_path = "ifixit_ontology.owl"
-onto = get_ontology(ontology_path).load()
+snapshot_path = "ifixit_ontology.sqlite3"
 
-with onto:
-    sync_reasoner()
+def export_signature():
+    """Modification time and size of the snapshot's meta file and store export.
 
-print(f"Ontology loaded with {len(list(onto.Procedure.instances()))} procedures.")
\ No newline at end of file
+    materialize and incremental loads write the meta file last, so a change
+    here means a new export has been (or is being) finished offline.
+    """
+    signature = []
+    for path in (meta_path(snapshot_path), store_path_for(snapshot_path)):
+        try:
+            stat = os.stat(path)
+            signature.append((stat.st_mtime_ns, stat.st_size))
+        except OSError:
+            signature.append(None)
+    return tuple(signature)
+
+class Snapshot:
+    """One loaded version of the data, with the indexes built from it.
+
+    The app reads a compact Store exported from the reasoned snapshot rather
+    than the owlready2 world itself.
+    """
+
+    def __init__(self, store, fulltext, signature):
+        self.signature = signature
+        self.store = store
+        self.fulltext = fulltext
+        # name -> index, and the builder that made it, so a reload can rebuild it
+        self.indexes = {}
+        self.builders = {}
+        # Reentrant, since one index may be built from another
+        self.lock = threading.RLock()
+
+    def index(self, name, builder):
+        index = self.indexes.get(name)
+        if index is None:
+            with self.lock:
+                index = self.indexes.get(name)
+                if index is None:
+                    index = builder()
+                    self.indexes[name] = index
+                    self.builders[name] = builder
+        return index
+
+def startup_snapshot():
+    """The Snapshot served first. Only here may the snapshot and its exports be
+    (re)built, if they are missing or older than the OWL file."""
+    store = load_store(ontology_path, snapshot_path)
+    fulltext = load_fulltext(store, snapshot_path)
+    return Snapshot(store, fulltext, export_signature())
+
+_current = startup_snapshot()
+_reload_lock = threading.Lock()
+_last_check = time.monotonic()
+_failed_signature = None
+
+print(f"Ontology loaded with {len(_current.store.procedures)} procedures.")
+
+def snapshot():
+    """The Snapshot in use. A request pins the current one the first time it asks,
+    so it sees a single version throughout even if a reload swaps in another."""
+    if has_app_context():
+        if 'snapshot' not in g:
+            g.snapshot = _current
+        return g.snapshot
+    return _current
+
+# Module-level names the rest of the app imports; each access resolves through snapshot()
+store = LocalProxy(lambda: snapshot().store)
+fulltext = LocalProxy(lambda: snapshot().fulltext)
+
+def reload(app):
+    """Read the exports on disk into a new Snapshot, rebuild every index the current
+    one has built, then swap it in. Requests already running keep the old one.
+
+    Nothing is materialized here: that is left to scripts/materialize.py and
+    load_data.py. Returns False if the exports on disk are incomplete.
+    """
+    global _current
+    old = _current
+    # Taken before reading, so an export finished during the read triggers another reload
+    signature = export_signature()
+    exports = read_exports(snapshot_path)
+    if exports is None:
+        return False
+    new = Snapshot(*exports, signature)
+    # A request context, so builders that render templates or build URLs work
+    with app.test_request_context():
+        g.snapshot = new
+        for name, builder in list(old.builders.items()):
+            try:
+                new.index(name, builder)
+            except Exception:
+                app.logger.exception(f"Could not prebuild '{name}'; it will be built on first use.")
+    _current = new
+    return True
+
+def _reload_in_background(app):
+    global _failed_signature
+    if not _reload_lock.acquire(blocking=False):
+        return
+    try:
+        start = time.perf_counter()
+        signature = export_signature()
+        if reload(app):
+            app.logger.info(f"Reloaded ontology with {len(_current.store.procedures)} procedures in {time.perf_counter() - start:.1f}s.")
+        else:
+            # Most likely an export still being written; it is picked up once the meta file changes
+            _failed_signature = signature
+            app.logger.info("The exported store is incomplete or does not match its snapshot; not reloading yet.")
+    except Exception:
+        # Keep serving the old data, and do not retry until the files change again
+        _failed_signature = export_signature()
+        app.logger.exception("Reloading the ontology failed; still serving the previous version.")
+    finally:
+        _reload_lock.release()
+
+def check_for_reload(app):
+    """Start a background reload if a new export was written since the current Snapshot was loaded.
+
+    Called at the start of every request, but looks at the files at most once per RELOAD_CHECK_INTERVAL seconds.
+    """
+    global _last_check
+    now = time.monotonic()
+    if now - _last_check < app.config['RELOAD_CHECK_INTERVAL']:
+        return
+    _last_check = now
+    signature = export_signature()
+    if signature in (_current.signature, _failed_signature) or _reload_lock.locked():
+        return
+    threading.Thread(target=_reload_in_background, args=(app,), daemon=True).start()
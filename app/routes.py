@@ -2,21 +2,26 @@
 from flask import render_template, request, redirect, url_for
 from app import app
 from app.forms import SearchForm
-from app.ontology import onto
+from app.ontology import store, check_for_reload
 import logging
-from app.helper import populate_facet_choices, get_all_subcategories, select_all_selected_category_titles, find_all_matching_procedures
+from app.helper import populate_facet_choices, populate_drilldown_choices, search_params, get_search_matches, get_all_subcategories, find_category, get_subcategories, get_top_categories, get_category_procedures, paginate, paginate_matches, get_procedure_detail, render_category_tree, category_tree_state, get_report_rows
+from app.search import get_search_index
 
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 
+@app.before_request
+def reload_if_changed():
+    check_for_reload(app)
+
 @app.route('/', methods=['GET', 'POST'])
 def index():
     form = SearchForm()
 
-    category_hierarchy, category_counts = populate_facet_choices(form)
-
     if form.validate_on_submit():
-        return redirect(url_for('search_results'))
+        return redirect(url_for('search_results', **search_params(form)))
+
+    category_hierarchy, category_counts = populate_facet_choices()
     
     return render_template(
         'index.html',
@@ -28,47 +33,52 @@ def index():
 
 @app.route('/search_results', methods=['GET', 'POST'])
 def search_results():
-    form = SearchForm(request.form)
+    # GET requests (e.g. page links) carry the same fields as query parameters
+    form = SearchForm(request.form if request.method == 'POST' else request.args)
 
-    # Populate form choices before validation
-    category_hierarchy, category_counts = populate_facet_choices(form)
+    if request.method == 'POST':
+        # Post/redirect/get: the results themselves are always served to a GET,
+        # so a repeated search is a match cache hit
+        if not form.validate_on_submit():
+            logging.warning(f"Invalid search submission, dropping unknown values: {form.errors}")
+        return redirect(url_for('search_results', **search_params(form)))
 
-    if form.validate_on_submit():
-        # Handle POST request with form data
-        query = form.query.data.lower().strip() if form.query.data else ''
-        selected_categories = form.categories.data if form.categories.data else []
-        selected_tools = form.tools.data if form.tools.data else []
-        selected_parts = form.parts.data if form.parts.data else []
-        logging.info(f"POST Request - Query: '{query}', Categories: {selected_categories}, Tools: {selected_tools}, Parts: {selected_parts}")
-    else:
-        # Handle GET request or form validation failure
-        query = request.args.get('query', '').lower().strip()
-        selected_categories = request.args.getlist('categories')
-        selected_tools = request.args.getlist('tools')
-        selected_parts = request.args.getlist('parts')
-        logging.info(f"GET Request - Query: '{query}', Categories: {selected_categories}, Tools: {selected_tools}, Parts: {selected_parts}")
+    # Parameters that reproduce this search, for the page links
+    search_args = search_params(form)
+    query = search_args['query']
+    logging.info(f"Search - Query: '{query}', Categories: {search_args['categories']}, Tools: {search_args['tools']}, Parts: {search_args['parts']}, Hazards: {search_args['hazards']}")
+
+    category_hierarchy, category_counts = populate_facet_choices()
+    matched = get_search_matches(search_args)
+    pagination = paginate_matches(matched, request.args.get('page', 1, type=int), app.config['SEARCH_RESULTS_PER_PAGE'], query)
 
-    selected_categories = select_all_selected_category_titles(selected_categories) # finds all subcategories of selected categories
-    matching_procedures = find_all_matching_procedures(query, selected_categories, selected_tools, selected_parts)
+    # Narrow the sidebar counts to the current selection
+    category_counts = populate_drilldown_choices(form, matched)
+    category_state = category_tree_state(search_args['categories'], None if matched == get_search_index().all_bits else category_counts)
 
     return render_template(
         'searchpage.html',
         title='Search',
         form=form,
-        procedures=matching_procedures,
+        procedures=pagination['items'],
+        pagination=pagination,
+        search_args=search_args,
         query=query,
         category_hierarchy=category_hierarchy,
-        category_counts=category_counts
+        category_counts=category_counts,
+        category_tree=render_category_tree(),
+        category_state=category_state
     )
 
 @app.route('/categories', methods=['GET', 'POST'])
 def categories_home():
     form = SearchForm()
-    category_hierarchy, category_counts = populate_facet_choices(form)
     if form.validate_on_submit():
-        return redirect(url_for('search_results'))
+        return redirect(url_for('search_results', **search_params(form)))
+
+    category_hierarchy, category_counts = populate_facet_choices()
     
-    top_categories = [cat for cat in onto.DeviceCategory.instances() if not cat.subcategory_of]
+    top_categories = get_top_categories()
 
     return render_template(
         'categories.html',
@@ -81,31 +91,25 @@ def categories_home():
 
 @app.route('/categories/<category_title>', methods=['GET', 'POST'])
 def category_detail(category_title):
-    # Normalize the category title for case-insensitive matching
-    decoded_title = category_title.lower()
-    
-    # Perform a case-insensitive search for the category
-    category = next(
-        (cat for cat in onto.DeviceCategory.instances() if cat.title and cat.title.lower() == decoded_title),
-        None
-    )
+    # Perform a case-insensitive lookup for the category
+    category = find_category(category_title)
     
     if not category:
         app.logger.error(f"Category with title '{category_title}' not found.")
         return render_template('404.html'), 404
 
-    parent_category = category.subcategory_of[0] if category.subcategory_of else None
+    parent_category = store.categories[category.parents[0]] if category.parents else None
     app.logger.info(f"Parent category for '{category.title}' is '{parent_category}'")
 
     # initialise the search form and populate facet choices
     form = SearchForm()
-    category_hierarchy, category_counts = populate_facet_choices(form)
-    
     if form.validate_on_submit():
-        return redirect(url_for('search_results'))
+        return redirect(url_for('search_results', **search_params(form)))
+
+    category_hierarchy, category_counts = populate_facet_choices()
     
     # **Retrieve Subcategories**
-    subcategories = [sub for sub in onto.DeviceCategory.instances() if category in sub.subcategory_of]
+    subcategories = get_subcategories(category)
     
     if subcategories:
         # **Render Subcategories Page**
@@ -122,21 +126,17 @@ def category_detail(category_title):
         all_subcategories = get_all_subcategories(category)
         all_categories = all_subcategories.union({category})
         
-        # Find all Items that belong to these categories
-        items = [item for item in onto.Item.instances() if any(cat in item.belongs_to_category for cat in all_categories)]
-        
-        # Find all Procedures linked to these Items via 'part_of'
-        procedures = [proc for proc in onto.Procedure.instances() if proc.part_of and proc.part_of[0] in items]
-        
-        # Debugging Statements
+        # Procedures of the Items in these categories, from the category -> procedures index
+        procedures = get_category_procedures(all_categories)
         app.logger.info(f"Found {len(procedures)} procedures for category '{category.title}' and its subcategories.")
-        for proc in procedures:
-            app.logger.info(f"Procedure: {proc.title}")
+
+        pagination = paginate(procedures, request.args.get('page', 1, type=int), app.config['GUIDES_PER_PAGE'])
         
         return render_template(
             'guides.html',
             form=form,
-            procedures=procedures,
+            procedures=pagination['items'],
+            pagination=pagination,
             category=category,
             category_hierarchy=category_hierarchy,
             category_counts=category_counts
@@ -144,53 +144,41 @@ def category_detail(category_title):
 
 @app.route('/procedure/<int:guidid>', methods=['GET', 'POST'])
 def procedure_detail(guidid):
-    procedure = onto.search_one(guidid=guidid)
+    detail = get_procedure_detail(guidid)
 
-    if not procedure:
+    if not detail:
         app.logger.error(f"Procedure with guidid '{guidid}' not found.")
         return render_template('404.html'), 404
 
     form = SearchForm()
-    category_hierarchy, category_counts = populate_facet_choices(form)
-    
     if form.validate_on_submit():
-        return redirect(url_for('search_results'))
-    
-    # Gather data
-    steps = sorted(procedure.consists_of, key=lambda s: s.order)
-
-    # Identify tools used in steps but missing in procedure's toolbox
-    tools_in_toolbox = set(procedure.uses_tool)
-    tools_used_in_steps = set()
-    for step in steps:
-        tools_used_in_steps.update(step.uses_tool)
-
-    missing_tools = tools_used_in_steps - tools_in_toolbox
-
-    # Identify steps with potential hazards
-    hazard_steps = []
-    hazard_keywords = ['careful', 'dangerous']
-    for step in steps:
-        description = step.description.lower()
-        if any(keyword in description for keyword in hazard_keywords):
-            hazard_steps.append(step)
-
-    # Retrieve the associated category via the 'part_of' relationship
-    if procedure.part_of and procedure.part_of[0].belongs_to_category:
-        category = procedure.part_of[0].belongs_to_category[0]  # Assuming single category
-        app.logger.info(f"Procedure '{procedure.title}' is linked to category '{category.title}'.")
-    else:
-        category = None  # Handle cases where category is not found
-        app.logger.warning(f"Procedure '{procedure.title}' is not linked to any category.")
+        return redirect(url_for('search_results', **search_params(form)))
+
+    category_hierarchy, category_counts = populate_facet_choices()
 
     return render_template(
         'procedure_detail.html',
         form=form,
-        procedure=procedure,
-        steps=steps,
-        missing_tools=missing_tools,
-        hazard_steps=hazard_steps,
-        category=category,
         category_hierarchy=category_hierarchy,
-        category_counts=category_counts
+        category_counts=category_counts,
+        **detail
+    )
+
+@app.route('/reports', methods=['GET', 'POST'])
+def reports():
+    form = SearchForm()
+    if form.validate_on_submit():
+        return redirect(url_for('search_results', **search_params(form)))
+
+    report_rows = get_report_rows(
+        request.args.get('min_steps', 6, type=int),
+        request.args.get('min_procedures', 10, type=int),
+        app.config['REPORT_ROWS'],
+    )
+
+    return render_template(
+        'reports.html',
+        title='Reports',
+        form=form,
+        **report_rows
     )
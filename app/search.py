@@ -0,0 +1,136 @@
+from array import array
+from collections import defaultdict
+from app.ontology import snapshot
+from app.cache import cached
+from ontology.fulltext import tokenize
+from ontology.bits import popcount, iter_bits
+
+class SearchIndex:
+    """In-memory index over procedures, keyed by dense ordinals.
+
+    Every posting list is a bitset stored in a Python int (bit i set means
+    procedure i matches), so filtering is a chain of ANDs and facet counts are
+    popcounts. Ordinals are the store's procedure ids, which are also the
+    document ids of the full-text index. Without a text query, results come
+    back in `onto.Procedure.instances()` order; with one, by BM25 score.
+    A query with no indexable words (only stop words or punctuation) falls
+    back to a substring match on titles, in store order.
+    """
+
+    def __init__(self, store, fulltext):
+        self.store = store
+        self.fulltext = fulltext
+        self.procedures = store.procedures
+        self.all_bits = (1 << len(self.procedures)) - 1
+        self.titles = [(procedure.title or '').lower() for procedure in self.procedures]
+        # Facet postings: lowercased category title / tool title / part title -> bitset
+        self.categories = defaultdict(int)
+        self.tools = defaultdict(int)
+        self.parts = defaultdict(int)
+        # Hazard tag -> bitset of procedures with at least one step carrying it
+        self.hazards = defaultdict(int)
+        # Category title -> bitset of procedures in that category or any of its subcategories
+        self.category_subtrees = defaultdict(int)
+
+        for ordinal, procedure in enumerate(self.procedures):
+            bit = 1 << ordinal
+            if procedure.item is not None:
+                for category_id in store.items[procedure.item].categories:
+                    category = store.categories[category_id]
+                    if category.title:
+                        self.categories[category.title.lower()] |= bit
+                    self._propagate_category_bit(category, bit)
+            for tool_id in procedure.tools:
+                self.tools[store.tools[tool_id].title] |= bit
+            for step_id in procedure.steps:
+                step = store.steps[step_id]
+                for part_id in step.parts:
+                    self.parts[store.parts[part_id].title] |= bit
+                for tag in step.hazards:
+                    self.hazards[tag] |= bit
+
+    def _propagate_category_bit(self, category, bit, seen=None):
+        seen = seen if seen is not None else set()
+        if category in seen:
+            return
+        seen.add(category)
+        self.category_subtrees[category.title] |= bit
+        for parent_id in category.parents:
+            self._propagate_category_bit(self.store.categories[parent_id], bit, seen)
+
+    def match_query(self, query):
+        """Bitset of procedures whose title, steps, parts or tools contain every query word."""
+        if not tokenize(query):
+            query = query.lower()
+            mask = bytearray((len(self.titles) + 7) // 8)
+            for ordinal, title in enumerate(self.titles):
+                if query in title:
+                    mask[ordinal >> 3] |= 1 << (ordinal & 7)
+            return int.from_bytes(mask, 'little')
+        return self.fulltext.matching_bits(query)
+
+    def match(self, query, selected_categories, selected_tools, selected_parts, selected_hazards=()):
+        """Bitset of procedures matching the query and every selected facet.
+
+        `selected_categories` holds lowercased titles (already expanded to
+        subcategories); a procedure matches if its item belongs to any of them.
+        Tools, parts and hazard tags must all be present.
+        """
+        bits = self.all_bits
+        if selected_categories:
+            category_bits = 0
+            for title in selected_categories:
+                category_bits |= self.categories.get(title, 0)
+            bits &= category_bits
+        for tool in set(selected_tools):
+            bits &= self.tools.get(tool, 0)
+        for part in set(selected_parts):
+            bits &= self.parts.get(part, 0)
+        for tag in set(selected_hazards):
+            bits &= self.hazards.get(tag, 0)
+        if query and bits:
+            bits &= self.match_query(query)
+        return bits
+
+    def procedures_for(self, bits):
+        return [self.procedures[i] for i in iter_bits(bits)]
+
+    def ordinals_slice(self, bits, start, count):
+        """Ordinals start..start+count (in result order) of the procedures in `bits`."""
+        ordinals = []
+        for i, ordinal in enumerate(iter_bits(bits)):
+            if i >= start + count:
+                break
+            if i >= start:
+                ordinals.append(ordinal)
+        return ordinals
+
+    def ranking(self, query, bits):
+        """Ordinals of all the procedures in `bits`, best BM25 score first; ties go to the lower ordinal."""
+        if not tokenize(query):
+            return array('I', iter_bits(bits))
+        allowed = None if bits == self.all_bits else bits.to_bytes((len(self.procedures) + 7) // 8, 'little')
+        scores = self.fulltext.scores(query, allowed)
+        return array('I', sorted(scores, key=lambda ordinal: (-scores[ordinal], ordinal)))
+
+    def display_records(self, ordinals):
+        """Procedure records for the given ordinals only."""
+        return [self.procedures[ordinal] for ordinal in ordinals]
+
+    def search(self, query, selected_categories, selected_tools, selected_parts, selected_hazards=()):
+        bits = self.match(query, selected_categories, selected_tools, selected_parts, selected_hazards)
+        if query:
+            return self.display_records(self.ranking(query, bits))
+        return self.procedures_for(bits)
+
+    def facet_counts(self, bits):
+        """Category, tool, part and hazard counts restricted to the procedures in `bits`."""
+        return (
+            {title: popcount(b & bits) for title, b in self.category_subtrees.items()},
+            {title: popcount(b & bits) for title, b in self.tools.items()},
+            {title: popcount(b & bits) for title, b in self.parts.items()},
+            {tag: popcount(b & bits) for tag, b in self.hazards.items()},
+        )
+
+def get_search_index():
+    return cached('search', lambda: SearchIndex(snapshot().store, snapshot().fulltext))
@@ -0,0 +1,126 @@
+import heapq
+from bisect import bisect_left
+from app.ontology import store
+from app.cache import cached
+from app.helper import get_facet_index
+
+SUGGEST_KINDS = ('procedure', 'category', 'tool', 'part')
+# Prefixes with more completions than this have their best ones precomputed;
+# anything narrower is ranked on the fly
+SCAN_LIMIT = 256
+# Most completions a single lookup can return
+TOP_K = 20
+# Sorts after every character a key can contain, to find the end of a prefix range
+MAX_CHAR = '\U0010ffff'
+
+def normalize(text):
+    return ' '.join(text.lower().split()) if text else ''
+
+def word_suffixes(title):
+    """The title from each word onwards, so 'bat' completes 'iPhone 6 Battery Replacement'."""
+    words = normalize(title).split(' ')
+    return {' '.join(words[i:]) for i in range(len(words)) if words[i]}
+
+class PrefixIndex:
+    """Ranked prefix completion over one kind of title.
+
+    Completion keys are kept in one sorted list, so the keys starting with a
+    prefix are a contiguous range found by binary search. Short prefixes can
+    match thousands of keys, so for every prefix whose range is wider than
+    SCAN_LIMIT the TOP_K best entries are worked out once at build time.
+    """
+
+    def __init__(self, entries):
+        # entries: (title, weight, ref) tuples
+        self.entries = entries
+        self.ranks = [(weight, -len(title)) for title, weight, _ in entries]
+        keyed = sorted((key, entry_id) for entry_id, (title, _, _) in enumerate(entries) for key in word_suffixes(title))
+        self.keys = [key for key, _ in keyed]
+        self.entry_ids = [entry_id for _, entry_id in keyed]
+        self.top = {}
+        self._precompute()
+
+    def _range(self, prefix, lo=0, hi=None):
+        hi = len(self.keys) if hi is None else hi
+        lo = bisect_left(self.keys, prefix, lo, hi)
+        return lo, bisect_left(self.keys, prefix + MAX_CHAR, lo, hi)
+
+    def _best(self, lo, hi, k):
+        """The `k` best distinct entries among keys lo..hi, best first."""
+        positions = heapq.nlargest(2 * k, range(lo, hi), key=lambda i: self.ranks[self.entry_ids[i]])
+        return list(dict.fromkeys(self.entry_ids[i] for i in positions))[:k]
+
+    def _precompute(self):
+        stack = [(0, len(self.keys), 0)]
+        while stack:
+            lo, hi, depth = stack.pop()
+            i = lo
+            while i < hi:
+                key = self.keys[i]
+                if len(key) <= depth:
+                    # The key is the parent prefix itself; no longer prefix can reach it
+                    i += 1
+                    continue
+                prefix = key[:depth + 1]
+                _, j = self._range(prefix, i, hi)
+                if j - i > SCAN_LIMIT:
+                    self.top[prefix] = self._best(i, j, TOP_K)
+                    stack.append((i, j, depth + 1))
+                i = j
+
+    def complete(self, prefix, limit):
+        """(rank, entry) pairs for the best `limit` entries completing `prefix`."""
+        lo, hi = self._range(prefix)
+        if hi - lo > SCAN_LIMIT:
+            entry_ids = self.top[prefix][:limit]
+        else:
+            entry_ids = self._best(lo, hi, limit)
+        return [(self.ranks[entry_id], self.entries[entry_id]) for entry_id in entry_ids]
+
+def build_suggest_index():
+    facets = get_facet_index()
+    category_counts = facets['category_counts']
+
+    def procedure_weight(procedure):
+        # Procedures have no facet count of their own; use their item's category
+        if procedure.item is None:
+            return 0
+        return max((category_counts.get(store.categories[category_id].title, 0)
+                    for category_id in store.items[procedure.item].categories), default=0)
+
+    return {
+        'procedure': PrefixIndex([
+            (procedure.title, procedure_weight(procedure), procedure.guidid)
+            for procedure in store.procedures if procedure.title
+        ]),
+        'category': PrefixIndex([
+            (category.title, category_counts.get(category.title, 0), category.title)
+            for category in store.categories if category.title
+        ]),
+        'tool': PrefixIndex([
+            (tool.title, facets['tool_counts'].get(tool.title, 0), tool.title)
+            for tool in store.tools if tool.title
+        ]),
+        'part': PrefixIndex([
+            (part.title, facets['part_counts'].get(part.title, 0), part.title)
+            for part in store.parts if part.title
+        ]),
+    }
+
+def get_suggest_index():
+    return cached('suggest', build_suggest_index)
+
+def suggest(query, kinds=SUGGEST_KINDS, limit=10):
+    """The best `limit` completions of `query` across `kinds`, as (kind, title, count, ref) tuples."""
+    prefix = normalize(query)
+    if not prefix or limit < 1:
+        return []
+    limit = min(limit, TOP_K)
+    indexes = get_suggest_index()
+    candidates = [
+        (rank, kind, entry)
+        for kind in kinds if kind in indexes
+        for rank, entry in indexes[kind].complete(prefix, limit)
+    ]
+    best = heapq.nlargest(limit, candidates, key=lambda candidate: candidate[0])
+    return [(kind, title, weight, ref) for _, kind, (title, weight, ref) in best]
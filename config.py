@@ -1,4 +1,18 @@
 import os
 
 class Config:
-    SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
\ No newline at end of file
+    SECRET_KEY = os.environ.get('SECRET_KEY') or 'you-will-never-guess'
+    GUIDES_PER_PAGE = 48
+    SEARCH_RESULTS_PER_PAGE = 48
+    PROCEDURE_DETAIL_CACHE_SIZE = 1024
+    SEARCH_MATCH_CACHE_SIZE = 256
+    # Each ranking holds 4 bytes per matched procedure
+    SEARCH_RANKING_CACHE_SIZE = 64
+    # Rows shown per table on /reports
+    REPORT_ROWS = 100
+    SUGGEST_LIMIT = 10
+    # Seconds clients and proxies may reuse an API response without revalidating
+    API_CACHE_MAX_AGE = 300
+    API_MAX_PER_PAGE = 200
+    # Seconds between checks for a newly exported store to reload in the background
+    RELOAD_CHECK_INTERVAL = 5
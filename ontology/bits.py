@@ -0,0 +1,15 @@
+"""Helpers for bitsets stored in Python ints, where bit i set means id i is present."""
+
+if hasattr(int, 'bit_count'):
+    def popcount(bits):
+        return bits.bit_count()
+else:
+    def popcount(bits):
+        return bin(bits).count('1')
+
+def iter_bits(bits):
+    """Yield the ids set in `bits`, lowest first."""
+    while bits:
+        low = bits & -bits
+        yield low.bit_length() - 1
+        bits ^= low
@@ -0,0 +1,272 @@
+"""BM25 full-text index over procedures, built from the Store at ingest.
+
+Every procedure is indexed as four fields: its title, the text of its steps,
+the names of the parts its steps involve and the names of the tools it uses.
+Postings are flat arrays: the procedure ids containing each term, in order, and
+for each of them the term's count in every field. The arrays are written to a
+single file that is memory-mapped when loaded, so forked workers share its
+pages rather than each holding a copy.
+
+A procedure matches a query when every query word is found in one of its
+fields, as an indexed term or the start of one. Words of MIN_INFIX letters or
+more also match inside title terms (so "mac" finds "imac" in a title), but
+not inside the step, part or tool vocabulary, where that mostly finds
+unrelated words. Scoring only orders the matches. It is BM25F: field counts
+are length-normalised per field, boosted, summed, and then saturated once per
+term. Terms a word only starts or is found inside count for less than the
+word itself.
+"""
+import heapq
+import json
+import math
+import mmap
+import os
+import re
+import struct
+import sys
+from array import array
+from bisect import bisect_left, bisect_right
+
+FULLTEXT_FORMAT = 2
+MAGIC = b'IFIXFTX\0'
+FIELDS = ('title', 'steps', 'parts', 'tools')
+TITLE = FIELDS.index('title')
+DEFAULT_BOOSTS = {'title': 3.0, 'steps': 1.0, 'parts': 1.5, 'tools': 1.5}
+K1 = 1.2
+B = 0.75
+# Query words at least this long also match title terms that merely contain them
+MIN_INFIX = 3
+# Scale of the idf of a term that a query word is the start of, or is found inside
+PREFIX_WEIGHT = 0.5
+INFIX_WEIGHT = 0.25
+MAX_TF = 0xFFFF
+
+TOKEN = re.compile(r"[a-z0-9]+")
+STOP_WORDS = frozenset(
+    "a an and are as at be by for from if in into is it its of on or so that the "
+    "then this to was will with you your".split()
+)
+
+def tokenize(text):
+    return [token for token in TOKEN.findall(text.lower()) if token not in STOP_WORDS] if text else []
+
+def procedure_fields(store, procedure):
+    """The text of each of FIELDS for one procedure."""
+    steps = [store.steps[step_id] for step_id in procedure.steps]
+    part_ids = sorted({part_id for step in steps for part_id in step.parts})
+    tool_ids = sorted(set(procedure.tools).union(*(step.tools for step in steps)))
+    return (
+        procedure.title or '',
+        ' '.join(step.description for step in steps if step.description),
+        ' '.join(store.parts[part_id].title for part_id in part_ids if store.parts[part_id].title),
+        ' '.join(store.tools[tool_id].title for tool_id in tool_ids if store.tools[tool_id].title),
+    )
+
+def write_fulltext(store, path):
+    """Index the procedures of `store` and write the index to `path`."""
+    field_count = len(FIELDS)
+    lengths = array('I')
+    postings = {}  # term -> {procedure id: [count per field]}
+    for procedure in store.procedures:
+        for f, text in enumerate(procedure_fields(store, procedure)):
+            tokens = tokenize(text)
+            lengths.append(len(tokens))
+            for token in tokens:
+                counts = postings.setdefault(token, {}).setdefault(procedure.id, [0] * field_count)
+                counts[f] += 1
+
+    terms = sorted(postings)
+    starts = [0]
+    docs = array('I')
+    tfs = array('H')
+    for term in terms:
+        for doc in sorted(postings[term]):
+            docs.append(doc)
+            tfs.extend(min(count, MAX_TF) for count in postings[term][doc])
+        starts.append(len(docs))
+
+    doc_count = len(store.procedures)
+    header = json.dumps({
+        'format': FULLTEXT_FORMAT,
+        'version': store.version,
+        'byteorder': sys.byteorder,
+        'fields': FIELDS,
+        'doc_count': doc_count,
+        'average_lengths': [
+            sum(lengths[d * field_count + f] for d in range(doc_count)) / doc_count if doc_count else 0.0
+            for f in range(field_count)
+        ],
+        'terms': terms,
+        'starts': starts,
+        'title_terms': [
+            term_id for term_id, term in enumerate(terms)
+            if any(counts[TITLE] for counts in postings[term].values())
+        ],
+    }).encode()
+    # Pad the header so the arrays after it start 4-byte aligned
+    header += b' ' * (-(len(MAGIC) + 4 + len(header)) % 4)
+
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        f.write(MAGIC)
+        f.write(struct.pack('<I', len(header)))
+        f.write(header)
+        lengths.tofile(f)
+        docs.tofile(f)
+        tfs.tofile(f)
+    os.replace(tmp_path, path)
+
+def read_fulltext(path):
+    """Map an index file, or return None if it is missing or unusable here."""
+    try:
+        with open(path, 'rb') as f:
+            data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    except (OSError, ValueError):
+        return None
+    try:
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError
+        offset = len(MAGIC) + 4
+        (header_length,) = struct.unpack('<I', data[len(MAGIC):offset])
+        header = json.loads(data[offset:offset + header_length])
+        if header.get('format') != FULLTEXT_FORMAT or header.get('byteorder') != sys.byteorder:
+            raise ValueError
+        return FullTextIndex(data, offset + header_length, header)
+    except (ValueError, KeyError, struct.error):
+        data.close()
+        return None
+
+def fulltext_path_for(snapshot_path):
+    return f"{os.path.splitext(snapshot_path)[0]}.fulltext"
+
+class FullTextIndex:
+    """Read-only view of an index file. The posting arrays stay in the mapping."""
+
+    def __init__(self, data, offset, header):
+        self._data = data
+        self.version = header['version']
+        self.doc_count = header['doc_count']
+        self.average_lengths = header['average_lengths']
+        self.terms = header['terms']
+        self.starts = header['starts']
+        # Every title term in one string, so finding those containing a word is a str.find loop
+        self.title_terms = header['title_terms']
+        self.title_vocabulary = '\n'.join(self.terms[term_id] for term_id in self.title_terms)
+        self.title_offsets = array('I')
+        position = 0
+        for term_id in self.title_terms:
+            self.title_offsets.append(position)
+            position += len(self.terms[term_id]) + 1
+
+        field_count = len(FIELDS)
+        posting_count = self.starts[-1]
+        view = memoryview(data)
+        end = offset + 4 * self.doc_count * field_count
+        self.lengths = view[offset:end].cast('I')
+        offset, end = end, end + 4 * posting_count
+        self.docs = view[offset:end].cast('I')
+        offset, end = end, end + 2 * posting_count * field_count
+        self.tfs = view[offset:end].cast('H')
+
+    def word_terms(self, word):
+        """(term id, weight, title only) for each indexed term a query word matches.
+
+        The word itself has weight 1 and the terms starting with it
+        PREFIX_WEIGHT, in every field. A word of MIN_INFIX letters or more also
+        matches the title terms containing it further in, with INFIX_WEIGHT and
+        in the title only.
+        """
+        matches = [
+            (term_id, 1.0 if self.terms[term_id] == word else PREFIX_WEIGHT, False)
+            for term_id in range(bisect_left(self.terms, word), bisect_left(self.terms, word + '\x7f'))
+        ]
+        if len(word) < MIN_INFIX:
+            return matches
+        vocabulary, offsets = self.title_vocabulary, self.title_offsets
+        position = vocabulary.find(word)
+        while position >= 0:
+            index = bisect_right(offsets, position) - 1
+            # A title term the word starts is already a prefix match
+            if position != offsets[index]:
+                matches.append((self.title_terms[index], INFIX_WEIGHT, True))
+            if index + 1 == len(offsets):
+                break
+            position = vocabulary.find(word, offsets[index + 1])
+        return matches
+
+    def query_words(self, query):
+        """The word_terms of each distinct query word."""
+        return [self.word_terms(word) for word in dict.fromkeys(tokenize(query))]
+
+    def query_terms(self, query):
+        """{term id: (weight, title only)} for the terms any query word matches, for scoring.
+
+        A term matched by several words keeps its best weight.
+        """
+        terms = {}
+        for matches in self.query_words(query):
+            for term_id, weight, title_only in matches:
+                if term_id not in terms or weight > terms[term_id][0]:
+                    terms[term_id] = (weight, title_only)
+        return terms
+
+    def matching_bits(self, query):
+        """Bitset of the procedures matching every word of `query`, which must have at least one token."""
+        field_count = len(FIELDS)
+        docs, tfs = self.docs, self.tfs
+        bits = None
+        for matches in self.query_words(query):
+            mask = bytearray((self.doc_count + 7) // 8)
+            for term_id, _, title_only in matches:
+                start, end = self.starts[term_id], self.starts[term_id + 1]
+                if title_only:
+                    for i in range(start, end):
+                        if tfs[i * field_count + TITLE]:
+                            doc = docs[i]
+                            mask[doc >> 3] |= 1 << (doc & 7)
+                else:
+                    for doc in docs[start:end]:
+                        mask[doc >> 3] |= 1 << (doc & 7)
+            word_bits = int.from_bytes(mask, 'little')
+            bits = word_bits if bits is None else bits & word_bits
+            if not bits:
+                break
+        return bits or 0
+
+    def scores(self, query, allowed=None, boosts=DEFAULT_BOOSTS):
+        """BM25F score of every procedure matching `query`.
+
+        `allowed` is an optional little-endian bitmask (bytes) of the procedures
+        to consider; the rest are skipped without being scored.
+        """
+        field_count = len(FIELDS)
+        weights = [boosts.get(field, 1.0) for field in FIELDS]
+        averages = [average or 1.0 for average in self.average_lengths]
+        lengths, docs, tfs = self.lengths, self.docs, self.tfs
+        scores = {}
+        for term_id, (weight, title_only) in self.query_terms(query).items():
+            start, end = self.starts[term_id], self.starts[term_id + 1]
+            idf = weight * math.log(1 + (self.doc_count - (end - start) + 0.5) / (end - start + 0.5))
+            fields = (TITLE,) if title_only else range(field_count)
+            for i in range(start, end):
+                doc = docs[i]
+                if allowed is not None and not allowed[doc >> 3] >> (doc & 7) & 1:
+                    continue
+                tf = 0.0
+                for f in fields:
+                    count = tfs[i * field_count + f]
+                    if count:
+                        norm = 1 - B + B * lengths[doc * field_count + f] / averages[f]
+                        tf += weights[f] * count / norm
+                if not tf:
+                    continue
+                scores[doc] = scores.get(doc, 0.0) + idf * tf * (K1 + 1) / (tf + K1)
+        return scores
+
+    def top(self, query, k, allowed=None, boosts=DEFAULT_BOOSTS):
+        """The `k` best-scoring procedure ids, best first; ties go to the lower id.
+
+        Uses a bounded heap, so only `k` candidates are ever kept in order.
+        """
+        scores = self.scores(query, allowed, boosts)
+        return [doc for doc, _ in heapq.nlargest(k, scores.items(), key=lambda entry: (entry[1], -entry[0]))]
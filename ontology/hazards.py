@@ -0,0 +1,94 @@
+"""Multi-keyword hazard detection over step descriptions.
+
+Terms from the hazard lexicon are compiled into an Aho-Corasick automaton, so
+scanning a description costs time linear in its length no matter how many
+terms the lexicon holds. A term matches as a whole word, or as the start of
+a word if the lexicon marks it as a stem with a trailing *.
+"""
+import hashlib
+from collections import deque
+from pathlib import Path
+
+DEFAULT_LEXICON = Path(__file__).with_name("hazard_lexicon.txt")
+
+def read_lexicon(path=DEFAULT_LEXICON):
+    """Parse a lexicon file into {tag: [terms]}; stems keep their trailing *."""
+    lexicon = {}
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line or line.startswith('#'):
+                continue
+            tag, _, terms = line.partition(':')
+            lexicon.setdefault(tag.strip(), []).extend(
+                term.strip().lower() for term in terms.split(',') if term.strip()
+            )
+    return lexicon
+
+def lexicon_hash(path=DEFAULT_LEXICON):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()
+
+class HazardMatcher:
+    def __init__(self, lexicon):
+        # Trie transitions, failure links and the (term, tag) pairs ending at each node
+        self.goto = [{}]
+        self.fail = [0]
+        self.out = [[]]
+        for tag, terms in lexicon.items():
+            for term in terms:
+                if term.endswith('*'):
+                    self._add(term[:-1], tag, True)
+                else:
+                    self._add(term, tag, False)
+
+        # Breadth-first, so every node's failure target is finished before its children
+        queue = deque(self.goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, child in self.goto[node].items():
+                queue.append(child)
+                fallback = self.fail[node]
+                while fallback and ch not in self.goto[fallback]:
+                    fallback = self.fail[fallback]
+                self.fail[child] = self.goto[fallback].get(ch, 0)
+                self.out[child] = self.out[child] + self.out[self.fail[child]]
+
+    def _add(self, term, tag, stem):
+        node = 0
+        for ch in term:
+            child = self.goto[node].get(ch)
+            if child is None:
+                child = len(self.goto)
+                self.goto[node][ch] = child
+                self.goto.append({})
+                self.fail.append(0)
+                self.out.append([])
+            node = child
+        if (term, tag, stem) not in self.out[node]:
+            self.out[node].append((term, tag, stem))
+
+    def matches(self, text):
+        """Yield (start, term, tag) for each lexicon term found as a word (or, for stems, a word start) in `text`."""
+        text = text.lower()
+        goto, fail, out = self.goto, self.fail, self.out
+        node = 0
+        for i, ch in enumerate(text):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for term, tag, stem in out[node]:
+                start = i - len(term) + 1
+                if start and text[start - 1].isalnum():
+                    continue
+                if stem or i + 1 == len(text) or not text[i + 1].isalnum():
+                    yield start, term, tag
+
+    def tags(self, text):
+        """Sorted tuple of the hazard tags found in `text`."""
+        if not text:
+            return ()
+        return tuple(sorted({tag for _, _, tag in self.matches(text)}))
+
+def load_matcher(path=DEFAULT_LEXICON):
+    return HazardMatcher(read_lexicon(path))
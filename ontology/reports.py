@@ -0,0 +1,66 @@
+"""Aggregates behind the example report queries, materialized with the Store.
+
+The tables are computed once when the Store is built: steps per procedure,
+procedures per item, toolbox tools that no step uses, step tools missing from
+the toolbox, and hazardous steps. The count tables are sorted by count, so a
+"more than N" threshold is one binary search.
+"""
+from array import array
+from bisect import bisect_right
+
+class Reports:
+    __slots__ = ('step_counts', 'step_count_keys', 'procedure_counts', 'procedure_count_keys',
+                 'unused_tools', 'missing_tools', 'hazard_steps')
+
+    def __init__(self, step_counts, procedure_counts, unused_tools, missing_tools, hazard_steps):
+        # (count, id) pairs in ascending order, with the counts alone for bisecting
+        self.step_counts = step_counts
+        self.step_count_keys = array('I', (count for count, _ in step_counts))
+        self.procedure_counts = procedure_counts
+        self.procedure_count_keys = array('I', (count for count, _ in procedure_counts))
+        # procedure id -> tool ids, only for procedures that have any
+        self.unused_tools = unused_tools
+        self.missing_tools = missing_tools
+        # procedure id -> (step number, step id) pairs of steps with hazard tags
+        self.hazard_steps = hazard_steps
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def procedures_with_more_steps(self, threshold):
+        """(step count, procedure id) pairs for procedures with more than `threshold` steps, most first."""
+        return self.step_counts[bisect_right(self.step_count_keys, threshold):][::-1]
+
+    def items_with_more_procedures(self, threshold):
+        """(procedure count, item id) pairs for items with more than `threshold` procedures, most first."""
+        return self.procedure_counts[bisect_right(self.procedure_count_keys, threshold):][::-1]
+
+def build_reports(store):
+    step_counts = sorted((len(procedure.steps), procedure.id) for procedure in store.procedures)
+
+    per_item = {}
+    for procedure in store.procedures:
+        if procedure.item is not None:
+            per_item[procedure.item] = per_item.get(procedure.item, 0) + 1
+    procedure_counts = sorted((count, item_id) for item_id, count in per_item.items())
+
+    unused_tools = {}
+    missing_tools = {}
+    hazard_steps = {}
+    for procedure in store.procedures:
+        steps = [store.steps[step_id] for step_id in procedure.steps]
+        toolbox = set(procedure.tools)
+        step_tools = {tool_id for step in steps for tool_id in step.tools}
+        if toolbox - step_tools:
+            unused_tools[procedure.id] = tuple(sorted(toolbox - step_tools))
+        if step_tools - toolbox:
+            missing_tools[procedure.id] = tuple(sorted(step_tools - toolbox))
+        hazardous = tuple((number, step.id) for number, step in enumerate(steps, 1) if step.hazards)
+        if hazardous:
+            hazard_steps[procedure.id] = hazardous
+
+    return Reports(step_counts, procedure_counts, unused_tools, missing_tools, hazard_steps)
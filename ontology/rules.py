@@ -0,0 +1,200 @@
+"""Forward-chaining engine for the SWRL rules in ontology/ifixit_ontology.py.
+
+The project's rules only come in two shapes, so rather than handing the whole
+graph to HermiT they are evaluated directly:
+
+- inverse rules, e.g. Step(?s) ^ involves_part(?s, ?p) -> Part(?p) ^ involved_in_step(?p, ?s)
+- transitive rules, e.g. Item(?x) ^ part_of(?x, ?y) ^ part_of(?y, ?z) -> part_of(?x, ?z)
+
+Facts are (subject IRI, predicate, object IRI) triples, with `TYPE` as the
+predicate and the class name as the object for class membership. Evaluation
+is semi-naive: each newly derived fact is joined once against the indexed
+facts, so adding facts later only does work proportional to what they change.
+The engine is saved next to the snapshot it reasoned (see ontology/snapshot.py),
+so an incremental load can reopen it and add only the facts it changed.
+"""
+import os
+import pickle
+from collections import defaultdict, deque
+
+TYPE = 'type'
+
+# (domain class, property, range class, inverse property)
+INVERSE_RULES = [
+    ('Step', 'involves_part', 'Part', 'involved_in_step'),   # rule1
+    ('Step', 'uses_tool', 'Tool', 'used_in'),                # rule2
+    ('Procedure', 'uses_tool', 'Tool', 'used_in'),           # rule3
+    ('Procedure', 'consists_of', 'Step', 'in_procedure'),    # rule4
+]
+
+# (subject class, transitive property)
+TRANSITIVE_RULES = [
+    ('Item', 'subclass_of'),      # rule6
+    ('Item', 'part_of'),          # rule7
+    ('Procedure', 'subprocedure'),  # rule9
+]
+
+RULE_CLASSES = sorted({c for rule in INVERSE_RULES for c in (rule[0], rule[2])} | {c for c, _ in TRANSITIVE_RULES})
+RULE_PROPERTIES = sorted({rule[1] for rule in INVERSE_RULES} | {p for _, p in TRANSITIVE_RULES})
+INFERRED_PROPERTIES = sorted({rule[3] for rule in INVERSE_RULES} | {p for _, p in TRANSITIVE_RULES})
+
+class RuleEngine:
+    def __init__(self):
+        # subject -> class names; property -> subject -> objects; property -> object -> subjects
+        self.types = {}
+        self.edges = {}
+        self.reverse = {}
+        self._index_rules()
+
+    def _index_rules(self):
+        self.inverse_by_property = defaultdict(list)
+        self.inverse_by_domain = defaultdict(list)
+        for rule in INVERSE_RULES:
+            self.inverse_by_property[rule[1]].append(rule)
+            self.inverse_by_domain[rule[0]].append(rule)
+        self.transitive_by_property = {p: c for c, p in TRANSITIVE_RULES}
+        self.transitive_by_class = defaultdict(list)
+        for c, p in TRANSITIVE_RULES:
+            self.transitive_by_class[c].append(p)
+
+    def __getstate__(self):
+        return {'types': self.types, 'edges': self.edges, 'reverse': self.reverse}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._index_rules()
+
+    def __contains__(self, fact):
+        s, p, o = fact
+        if p == TYPE:
+            return o in self.types.get(s, ())
+        return o in self.edges.get(p, {}).get(s, ())
+
+    def _insert(self, fact):
+        if fact in self:
+            return False
+        s, p, o = fact
+        if p == TYPE:
+            self.types.setdefault(s, set()).add(o)
+        else:
+            self.edges.setdefault(p, {}).setdefault(s, set()).add(o)
+            self.reverse.setdefault(p, {}).setdefault(o, set()).add(s)
+        return True
+
+    def _consequences(self, fact):
+        s, p, o = fact
+        if p == TYPE:
+            for _, prop, range_cls, inverse in self.inverse_by_domain.get(o, ()):
+                for target in self.edges.get(prop, {}).get(s, ()):
+                    yield (target, TYPE, range_cls)
+                    yield (target, inverse, s)
+            # s is now eligible as the head of a transitive rule
+            for prop in self.transitive_by_class.get(o, ()):
+                edges = self.edges.get(prop, {})
+                for y in list(edges.get(s, ())):
+                    for z in edges.get(y, ()):
+                        yield (s, prop, z)
+            return
+
+        for domain_cls, _, range_cls, inverse in self.inverse_by_property.get(p, ()):
+            if domain_cls in self.types.get(s, ()):
+                yield (o, TYPE, range_cls)
+                yield (o, inverse, s)
+
+        head_cls = self.transitive_by_property.get(p)
+        if head_cls:
+            edges = self.edges.get(p, {})
+            # new s->o followed by existing o->z
+            if head_cls in self.types.get(s, ()):
+                for z in edges.get(o, ()):
+                    yield (s, p, z)
+            # existing w->s followed by new s->o
+            for w in self.reverse.get(p, {}).get(s, ()):
+                if head_cls in self.types.get(w, ()):
+                    yield (w, p, o)
+
+    def add(self, facts):
+        """Add asserted facts and return the facts newly inferred from them."""
+        queue = deque(fact for fact in facts if self._insert(fact))
+        inferred = []
+        while queue:
+            fact = queue.popleft()
+            for consequence in list(self._consequences(fact)):
+                if self._insert(consequence):
+                    inferred.append(consequence)
+                    queue.append(consequence)
+        return inferred
+
+    def remove(self, iri):
+        """Forget every fact about or pointing at a destroyed entity.
+
+        Facts derived through it about other entities are kept. The loader
+        only destroys procedures and steps, and every fact derived from them
+        (in_procedure, used_in, involved_in_step) is about them.
+        """
+        self.types.pop(iri, None)
+        for p, edges in self.edges.items():
+            reverse = self.reverse[p]
+            for o in edges.pop(iri, ()):
+                reverse[o].discard(iri)
+            for s in reverse.pop(iri, ()):
+                edges[s].discard(iri)
+
+def facts_from_ontology(onto):
+    """Asserted class memberships and rule-relevant property values of `onto`."""
+    for class_name in RULE_CLASSES:
+        for entity in getattr(onto, class_name).instances():
+            yield (entity.iri, TYPE, class_name)
+    for prop in RULE_PROPERTIES:
+        for subject, obj in getattr(onto, prop).get_relations():
+            yield (subject.iri, prop, obj.iri)
+
+def entity_facts(onto, entities):
+    """Class memberships and rule-relevant property values of just `entities`."""
+    classes = [(getattr(onto, class_name), class_name) for class_name in RULE_CLASSES]
+    for entity in entities:
+        for cls, class_name in classes:
+            if isinstance(entity, cls):
+                yield (entity.iri, TYPE, class_name)
+        for prop in RULE_PROPERTIES:
+            for obj in getattr(entity, prop, ()):
+                yield (entity.iri, prop, obj.iri)
+
+def apply_facts(onto, facts):
+    """Write inferred facts back into `onto`."""
+    world = onto.world
+    with onto:
+        for s, p, o in facts:
+            subject = world[s]
+            if p == TYPE:
+                cls = getattr(onto, o)
+                if cls not in subject.is_a:
+                    subject.is_a.append(cls)
+            else:
+                values = getattr(subject, p)
+                obj = world[o]
+                if obj not in values:
+                    values.append(obj)
+
+def reason(onto):
+    """Run the project's rules over `onto` in place and return the engine, which holds
+    every asserted and inferred fact so later edits can be reasoned incrementally."""
+    engine = RuleEngine()
+    inferred = engine.add(facts_from_ontology(onto))
+    apply_facts(onto, inferred)
+    return engine
+
+def write_engine(engine, version, path):
+    """Save `engine` for the snapshot built from the source with hash `version`."""
+    with open(f"{path}.tmp", 'wb') as f:
+        pickle.dump((version, engine), f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(f"{path}.tmp", path)
+
+def read_engine(path, version):
+    """The engine saved at `path` for `version`, or None if it is missing, unreadable or for another version."""
+    try:
+        with open(path, 'rb') as f:
+            saved_version, engine = pickle.load(f)
+    except (OSError, pickle.UnpicklingError, EOFError, AttributeError, ValueError):
+        return None
+    return engine if saved_version == version else None
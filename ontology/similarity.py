@@ -0,0 +1,91 @@
+"""Similar-procedure recommendations from MinHash signatures and LSH banding.
+
+A procedure's features are its tools, the parts its steps involve and the
+categories of its item. Two procedures are similar when those feature sets
+have a high Jaccard index. Comparing every pair is O(P^2), so instead each
+procedure gets a MinHash signature. The signature is cut into BANDS bands of
+ROWS values, and procedures that agree on a whole band share a bucket. Only
+procedures sharing at least one bucket are compared exactly.
+
+More rows per band raise precision, because fewer dissimilar pairs collide.
+More bands raise recall. A pair with Jaccard index s becomes a candidate with
+probability 1 - (1 - s**ROWS)**BANDS. scripts/benchmark_similar.py measures
+the trade-off against exact Jaccard.
+"""
+import random
+
+BANDS = 16
+ROWS = 4
+# Similar procedures kept per procedure
+TOP_K = 10
+# Procedures compared per procedure at most, so huge buckets (e.g. many
+# guides with identical feature sets) do not turn back into O(P^2)
+MAX_CANDIDATES = 500
+# Signatures must not change between runs, so the hash functions are seeded
+SEED = 3005
+PRIME = (1 << 61) - 1
+
+def procedure_features(store, procedure):
+    """Feature ids of a procedure: tools, parts and item categories in separate ranges."""
+    features = {3 * tool_id for tool_id in procedure.tools}
+    for step_id in procedure.steps:
+        features.update(3 * part_id + 1 for part_id in store.steps[step_id].parts)
+    if procedure.item is not None:
+        features.update(3 * category_id + 2 for category_id in store.items[procedure.item].categories)
+    return frozenset(features)
+
+def jaccard(a, b):
+    if not a and not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+class MinHasher:
+    def __init__(self, num_hashes, seed=SEED):
+        rng = random.Random(seed)
+        self.coefficients = [(rng.randrange(1, PRIME), rng.randrange(PRIME)) for _ in range(num_hashes)]
+        # feature -> its value under every hash function; features are shared by many procedures
+        self.hashes = {}
+
+    def feature_hashes(self, feature):
+        values = self.hashes.get(feature)
+        if values is None:
+            values = self.hashes[feature] = tuple((a * feature + b) % PRIME for a, b in self.coefficients)
+        return values
+
+    def signature(self, features):
+        return tuple(map(min, zip(*(self.feature_hashes(feature) for feature in features))))
+
+def lsh_candidates(signatures, bands=BANDS, rows=ROWS):
+    """For each procedure with a signature, the procedures sharing at least one band bucket with it."""
+    buckets = {}
+    for procedure_id, signature in signatures.items():
+        for band in range(bands):
+            key = (band, signature[band * rows:(band + 1) * rows])
+            buckets.setdefault(key, []).append(procedure_id)
+
+    candidates = {procedure_id: set() for procedure_id in signatures}
+    for members in buckets.values():
+        if len(members) < 2:
+            continue
+        for procedure_id in members:
+            found = candidates[procedure_id]
+            if len(found) < MAX_CANDIDATES:
+                found.update(members[:MAX_CANDIDATES])
+    return candidates
+
+def build_similar(store, bands=BANDS, rows=ROWS, top_k=TOP_K):
+    """procedure id -> ((procedure id, Jaccard index), ...) of its most similar procedures, best first."""
+    features = {procedure.id: procedure_features(store, procedure) for procedure in store.procedures}
+    hasher = MinHasher(bands * rows)
+    signatures = {procedure_id: hasher.signature(found) for procedure_id, found in features.items() if found}
+
+    similar = {}
+    for procedure_id, candidates in lsh_candidates(signatures, bands, rows).items():
+        candidates.discard(procedure_id)
+        scored = sorted(
+            ((jaccard(features[procedure_id], features[other]), other) for other in candidates),
+            key=lambda entry: (-entry[0], entry[1]),
+        )[:top_k]
+        if scored:
+            similar[procedure_id] = tuple((other, score) for score, other in scored)
+    return similar
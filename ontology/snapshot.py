@@ -0,0 +1,182 @@
+"""Materialized-inference snapshots of the iFixit ontology.
+
+Inference is done once by `materialize`, using either the built-in rule engine
+(ontology/rules.py, the default) or the HermiT reasoner, and the reasoned world
+is kept as an owlready2 SQLite quadstore, alongside a compact read-only Store
+export of it for the web app (ontology/store.py), a full-text index of that
+Store (ontology/fulltext.py) and the rule engine's facts, for incremental
+updates. A small JSON file next to the snapshot records the hash of the OWL
+file it was built from, so a snapshot is only rebuilt when the source changes.
+"""
+import hashlib
+import json
+import os
+import shutil
+from pathlib import Path
+from owlready2 import World, sync_reasoner
+from ontology.rules import reason, entity_facts, apply_facts, write_engine, read_engine
+from ontology.store import build_store, write_store, read_store, store_path_for
+from ontology.hazards import lexicon_hash
+from ontology.fulltext import write_fulltext, read_fulltext, fulltext_path_for
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def meta_path(snapshot_path):
+    return f"{snapshot_path}.json"
+
+def engine_path_for(snapshot_path):
+    return f"{snapshot_path}.rules"
+
+def read_meta(snapshot_path):
+    try:
+        with open(meta_path(snapshot_path)) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_meta(snapshot_path, meta):
+    with open(f"{meta_path(snapshot_path)}.tmp", 'w') as f:
+        json.dump(meta, f)
+    os.replace(f"{meta_path(snapshot_path)}.tmp", meta_path(snapshot_path))
+
+def is_fresh(source_path, snapshot_path):
+    """True if the snapshot exists and was built from the current source file."""
+    meta = read_meta(snapshot_path)
+    return (
+        meta is not None
+        and os.path.isfile(snapshot_path)
+        and meta.get('source_sha256') == file_hash(source_path)
+    )
+
+def export(onto, version, snapshot_path):
+    """Write the Store and full-text index files that go with a snapshot."""
+    store = build_store(onto, version)
+    write_store(store, store_path_for(snapshot_path))
+    write_fulltext(store, fulltext_path_for(snapshot_path))
+
+def materialize(source_path, snapshot_path, use_hermit=False):
+    """Load `source_path`, run inference and write the result to `snapshot_path`."""
+    source_hash = file_hash(source_path)
+    # Build under a private name and swap it in, so concurrent readers never see a partial file
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+
+    world = World(filename=tmp_path)
+    onto = world.get_ontology(Path(source_path).resolve().as_uri()).load()
+    if use_hermit:
+        with onto:
+            sync_reasoner(world)
+    # After HermiT this derives nothing new, but it still collects the facts for the saved engine
+    engine = reason(onto)
+    world.save()
+    export(onto, source_hash, snapshot_path)
+    write_engine(engine, source_hash, engine_path_for(snapshot_path))
+    world.close()
+
+    os.replace(tmp_path, snapshot_path)
+    write_meta(snapshot_path, {
+        'source_sha256': source_hash,
+        'base_iri': onto.base_iri,
+        'reasoner': 'hermit' if use_hermit else 'rules',
+    })
+
+def update_snapshot(source_path, snapshot_path, previous_hash, apply_changes):
+    """Bring a snapshot up to date with an edited source file without re-materializing.
+
+    `apply_changes(onto)` must make the same edits to the snapshot's ontology
+    that were made to the source, and return the IRIs of the entities it
+    destroyed and the entities it created or changed. The rule engine saved
+    with the snapshot forgets the destroyed entities and reasons only over the
+    changed entities' facts; if it is missing, every fact is reasoned over
+    again. The Store and full-text index are still exported in full from the
+    updated snapshot.
+
+    Returns False, leaving the snapshot alone, if it was not built from the
+    source as it was before the edits (`previous_hash`).
+    """
+    meta = read_meta(snapshot_path)
+    if not meta or meta.get('source_sha256') != previous_hash or not os.path.isfile(snapshot_path):
+        return False
+
+    engine = read_engine(engine_path_for(snapshot_path), previous_hash)
+    tmp_path = f"{snapshot_path}.{os.getpid()}.tmp"
+    shutil.copyfile(snapshot_path, tmp_path)
+    world = World(filename=tmp_path)
+    onto = world.get_ontology(meta['base_iri'])
+    retracted, touched = apply_changes(onto)
+    if engine is None:
+        engine = reason(onto)
+    else:
+        for iri in retracted:
+            engine.remove(iri)
+        apply_facts(onto, engine.add(entity_facts(onto, touched)))
+    world.save()
+    source_hash = file_hash(source_path)
+    export(onto, source_hash, snapshot_path)
+    write_engine(engine, source_hash, engine_path_for(snapshot_path))
+    world.close()
+
+    os.replace(tmp_path, snapshot_path)
+    write_meta(snapshot_path, dict(meta, source_sha256=source_hash))
+    return True
+
+def open_snapshot(snapshot_path):
+    """Open a materialized snapshot without reasoning and return its ontology."""
+    meta = read_meta(snapshot_path)
+    world = World(filename=snapshot_path, exclusive=False)
+    return world.get_ontology(meta['base_iri'])
+
+def load_reasoned(source_path, snapshot_path):
+    """Return the reasoned ontology, materializing first if the snapshot is missing or stale."""
+    if not is_fresh(source_path, snapshot_path):
+        materialize(source_path, snapshot_path)
+    return open_snapshot(snapshot_path)
+
+def load_store(source_path, snapshot_path, freeze=True):
+    """Return the app's read-only Store, rebuilding the snapshot and/or store only if stale.
+
+    `freeze` is passed to read_store; it only helps for a store loaded before workers fork.
+    """
+    if not is_fresh(source_path, snapshot_path):
+        materialize(source_path, snapshot_path)
+    version = read_meta(snapshot_path)['source_sha256']
+    store_path = store_path_for(snapshot_path)
+    store = read_store(store_path, freeze)
+    if store is None or store.version != version or store.hazard_lexicon != lexicon_hash():
+        onto = open_snapshot(snapshot_path)
+        write_store(build_store(onto, version), store_path)
+        onto.world.close()
+        store = read_store(store_path, freeze)
+    return store
+
+def read_exports(snapshot_path, freeze=False):
+    """The Store and full-text index last exported for a snapshot, without building anything.
+
+    Returns None if either is missing or they do not belong to the snapshot
+    its meta file describes, e.g. while materialize is still writing them.
+    """
+    meta = read_meta(snapshot_path)
+    if meta is None:
+        return None
+    store = read_store(store_path_for(snapshot_path), freeze)
+    if store is None or store.version != meta.get('source_sha256'):
+        return None
+    fulltext = read_fulltext(fulltext_path_for(snapshot_path))
+    if fulltext is None or fulltext.version != store.version:
+        return None
+    return store, fulltext
+
+def load_fulltext(store, snapshot_path):
+    """Return the full-text index for `store`, rebuilding it only if it is missing or stale."""
+    path = fulltext_path_for(snapshot_path)
+    index = read_fulltext(path)
+    if index is None or index.version != store.version:
+        write_fulltext(store, path)
+        index = read_fulltext(path)
+    return index
@@ -0,0 +1,177 @@
+"""Compact, read-only copy of the reasoned ontology for the web app.
+
+Every entity the app displays is flattened into a small `__slots__` record.
+Records refer to each other by integer id (their index in the Store's list
+for that type) and strings are interned, so the whole store pickles into one
+compact file. The app loads that file instead of opening the owlready2 world.
+"""
+import gc
+import os
+import pickle
+import sys
+from ontology.hazards import load_matcher, lexicon_hash
+from ontology.reports import build_reports
+from ontology.similarity import build_similar
+from ontology.toolkit import build_tool_bits
+
+# Bump when the record layout changes so stale store files get rebuilt
+STORE_FORMAT = 5
+
+class Record:
+    __slots__ = ()
+
+    def __init__(self, *values):
+        for name, value in zip(self.__slots__, values):
+            object.__setattr__(self, name, value)
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} records are read-only")
+
+    def __reduce__(self):
+        return (type(self), tuple(getattr(self, name) for name in self.__slots__))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({self.id}, {getattr(self, 'title', None)!r})"
+
+class Category(Record):
+    __slots__ = ('id', 'title', 'parents', 'children')
+
+class Item(Record):
+    __slots__ = ('id', 'title', 'url', 'categories')
+
+class Tool(Record):
+    __slots__ = ('id', 'title', 'url', 'thumbnail')
+
+class Part(Record):
+    __slots__ = ('id', 'title')
+
+class Step(Record):
+    # actions are action titles, images are image URLs, hazards are hazard lexicon tags
+    __slots__ = ('id', 'stepid', 'order', 'description', 'tools', 'parts', 'actions', 'images', 'hazards')
+
+class Procedure(Record):
+    # steps are sorted by their order; image is the URL of the first image, if any
+    __slots__ = ('id', 'guidid', 'title', 'url', 'description', 'item', 'steps', 'tools', 'subprocedures', 'image')
+
+class Store:
+    __slots__ = ('format', 'version', 'hazard_lexicon', 'categories', 'items', 'tools', 'parts', 'steps', 'procedures', 'by_guidid', 'reports', 'similar', 'tool_bits')
+
+    def __init__(self, version, hazard_lexicon, categories, items, tools, parts, steps, procedures):
+        self.format = STORE_FORMAT
+        self.version = version
+        self.hazard_lexicon = hazard_lexicon
+        self.categories = categories
+        self.items = items
+        self.tools = tools
+        self.parts = parts
+        self.steps = steps
+        self.procedures = procedures
+        self.by_guidid = {procedure.guidid: procedure.id for procedure in procedures}
+        self.reports = build_reports(self)
+        # procedure id -> ((procedure id, similarity), ...), see ontology/similarity.py
+        self.similar = build_similar(self)
+        # procedure id -> bitset of the tool ids it needs, see ontology/toolkit.py
+        self.tool_bits = build_tool_bits(self)
+
+    def __getstate__(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+    def __setstate__(self, state):
+        for name, value in state.items():
+            setattr(self, name, value)
+
+    def procedure(self, guidid):
+        ordinal = self.by_guidid.get(guidid)
+        return self.procedures[ordinal] if ordinal is not None else None
+
+def _text(value):
+    return sys.intern(value) if isinstance(value, str) else value
+
+def build_store(onto, version):
+    """Flatten the entities of a reasoned ontology into a Store.
+
+    Step descriptions are scanned for hazards here, once, so the app only reads the tags.
+    """
+    hazards = load_matcher()
+    kinds = {
+        'categories': list(onto.DeviceCategory.instances()),
+        'items': list(onto.Item.instances()),
+        'tools': list(onto.Tool.instances()),
+        'parts': list(onto.Part.instances()),
+        'steps': list(onto.Step.instances()),
+        'procedures': list(onto.Procedure.instances()),
+    }
+    ids = {kind: {entity: i for i, entity in enumerate(entities)} for kind, entities in kinds.items()}
+
+    def refs(kind, entities):
+        return tuple(ids[kind][entity] for entity in entities if entity in ids[kind])
+
+    children = {category: [] for category in kinds['categories']}
+    for category in kinds['categories']:
+        for parent in category.subcategory_of:
+            if parent in children:
+                children[parent].append(category)
+    categories = [
+        Category(i, _text(category.title), refs('categories', category.subcategory_of), refs('categories', children[category]))
+        for i, category in enumerate(kinds['categories'])
+    ]
+    items = [
+        Item(i, _text(item.title), item.url, refs('categories', item.belongs_to_category))
+        for i, item in enumerate(kinds['items'])
+    ]
+    tools = [
+        Tool(i, _text(tool.title), tool.url, tool.thumbnail)
+        for i, tool in enumerate(kinds['tools'])
+    ]
+    parts = [Part(i, _text(part.title)) for i, part in enumerate(kinds['parts'])]
+    steps = [
+        Step(
+            i, step.stepid, step.order, step.description,
+            refs('tools', step.uses_tool),
+            refs('parts', step.involves_part),
+            tuple(_text(action.title) for action in step.action),
+            tuple(image.url for image in step.image),
+            hazards.tags(step.description),
+        )
+        for i, step in enumerate(kinds['steps'])
+    ]
+    procedures = []
+    for i, procedure in enumerate(kinds['procedures']):
+        ordered_steps = sorted(procedure.consists_of, key=lambda s: (s.order is None, s.order or 0))
+        item = procedure.part_of[0] if procedure.part_of else None
+        images = procedure.image
+        procedures.append(Procedure(
+            i, procedure.guidid, _text(procedure.title), procedure.url, procedure.description,
+            ids['items'].get(item),
+            refs('steps', ordered_steps),
+            refs('tools', procedure.uses_tool),
+            refs('procedures', procedure.subprocedure),
+            images[0].url if images else None,
+        ))
+
+    return Store(version, lexicon_hash(), categories, items, tools, parts, steps, procedures)
+
+def write_store(store, store_path):
+    tmp_path = f"{store_path}.{os.getpid()}.tmp"
+    with open(tmp_path, 'wb') as f:
+        pickle.dump(store, f, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(tmp_path, store_path)
+
+def read_store(store_path, freeze=True):
+    """Load a store file, or return None if it is missing or in an old format."""
+    try:
+        with open(store_path, 'rb') as f:
+            store = pickle.load(f)
+    except (OSError, ValueError, pickle.UnpicklingError, EOFError, AttributeError):
+        return None
+    if getattr(store, 'format', None) != STORE_FORMAT:
+        return None
+    if freeze:
+        # Keep the loaded records out of the cyclic GC, so collections in forked
+        # workers do not write to them. Reference counting still does, so a
+        # worker ends up copying the pages of the records it reads.
+        gc.freeze()
+    return store
+
+def store_path_for(snapshot_path):
+    return f"{os.path.splitext(snapshot_path)[0]}.store"
@@ -0,0 +1,80 @@
+"""Toolkit planning for a batch of procedures.
+
+Every procedure's tools (its toolbox plus any tool a step uses) are kept with
+the Store as one bitset in a Python int, where bit i set means tool id i is
+needed. The union toolkit for a batch is then one OR per procedure. The plan
+answers "which tools to bring first": it is a greedy set cover over the
+distinct tool sets in the batch. Procedures that need the same tools are
+grouped. Each round adds the group that completes the most procedures per
+new tool, and every group whose remaining tools are now all in the kit is
+completed with it.
+"""
+from ontology.bits import popcount, iter_bits
+
+def build_tool_bits(store):
+    """Bitset of the tools each procedure needs, indexed by procedure id."""
+    tool_bits = []
+    for procedure in store.procedures:
+        bits = 0
+        for tool_id in procedure.tools:
+            bits |= 1 << tool_id
+        for step_id in procedure.steps:
+            for tool_id in store.steps[step_id].tools:
+                bits |= 1 << tool_id
+        tool_bits.append(bits)
+    return tuple(tool_bits)
+
+def plan_toolkit(tool_bits, procedure_ids, max_tools=None):
+    """Union toolkit and greedy plan for the given procedure ids.
+
+    Returns a dict with
+    - 'toolkit': (tool id, procedures needing it) pairs, most needed first
+    - 'steps': (tool ids added, procedure ids completed) pairs, in the order to
+      pack them; a first step with no tools lists procedures that need none
+    - 'incomplete': procedure ids left out because of `max_tools`
+    """
+    # remaining tool bits -> procedure ids that still need exactly those tools
+    groups = {}
+    for procedure_id in dict.fromkeys(procedure_ids):
+        groups.setdefault(tool_bits[procedure_id], []).append(procedure_id)
+
+    needed = {}
+    for bits, members in groups.items():
+        for tool_id in iter_bits(bits):
+            needed[tool_id] = needed.get(tool_id, 0) + len(members)
+    toolkit = sorted(needed.items(), key=lambda entry: (-entry[1], entry[0]))
+
+    steps = []
+    if 0 in groups:
+        steps.append(((), tuple(groups.pop(0))))
+
+    kit = 0
+    while groups:
+        budget = None if max_tools is None else max_tools - popcount(kit)
+        best, best_score = None, None
+        for bits, members in groups.items():
+            cost = popcount(bits)
+            if budget is not None and cost > budget:
+                continue
+            score = (len(members) / cost, -cost)
+            if best_score is None or score > best_score:
+                best, best_score = bits, score
+        if best is None:
+            break
+
+        kit |= best
+        remaining, completed = {}, []
+        for bits, members in groups.items():
+            left = bits & ~kit
+            if left:
+                remaining.setdefault(left, []).extend(members)
+            else:
+                completed.extend(members)
+        steps.append((tuple(iter_bits(best)), tuple(completed)))
+        groups = remaining
+
+    return {
+        'toolkit': toolkit,
+        'steps': steps,
+        'incomplete': tuple(procedure_id for members in groups.values() for procedure_id in members),
+    }
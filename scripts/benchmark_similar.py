@@ -0,0 +1,67 @@
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.snapshot import load_store
+from ontology.similarity import BANDS, ROWS, TOP_K, build_similar, procedure_features, jaccard
+
+ONTOLOGY_FILE = "ifixit_ontology.owl"
+SNAPSHOT_FILE = "ifixit_ontology.sqlite3"
+
+def exact_top_k(features, procedure_id, k):
+    """The k most similar procedures by comparing against every other one."""
+    mine = features[procedure_id]
+    scored = sorted(
+        ((jaccard(mine, found), other) for other, found in features.items() if other != procedure_id and found),
+        key=lambda entry: (-entry[0], entry[1]),
+    )
+    return [(other, score) for score, other in scored[:k] if score > 0]
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the MinHash/LSH similar procedures against exact Jaccard.")
+    parser.add_argument("--bands", type=int, default=BANDS, help=f"number of LSH bands (default: {BANDS})")
+    parser.add_argument("--rows", type=int, default=ROWS, help=f"signature values per band (default: {ROWS})")
+    parser.add_argument("-k", type=int, default=TOP_K, help=f"similar procedures per procedure (default: {TOP_K})")
+    parser.add_argument("--sample", type=int, default=200, help="procedures to check against exact Jaccard (default: 200)")
+    parser.add_argument("--seed", type=int, default=0, help="seed for choosing the sample")
+    args = parser.parse_args()
+
+    store = load_store(ONTOLOGY_FILE, SNAPSHOT_FILE)
+    features = {procedure.id: procedure_features(store, procedure) for procedure in store.procedures}
+    print(f"{len(store.procedures)} procedures, {args.bands} bands x {args.rows} rows, top {args.k}")
+    for s in (0.2, 0.4, 0.6, 0.8):
+        print(f"- a pair with Jaccard {s} is compared with probability {1 - (1 - s ** args.rows) ** args.bands:.2f}")
+
+    start = time.perf_counter()
+    similar = build_similar(store, args.bands, args.rows, args.k)
+    lsh_seconds = time.perf_counter() - start
+    print(f"LSH index built in {lsh_seconds:.2f}s")
+
+    candidates = [procedure_id for procedure_id, found in features.items() if found]
+    sample = random.Random(args.seed).sample(candidates, min(args.sample, len(candidates)))
+
+    start = time.perf_counter()
+    exact = {procedure_id: exact_top_k(features, procedure_id, args.k) for procedure_id in sample}
+    exact_seconds = time.perf_counter() - start
+
+    # A result counts as found if it scores at least as well as the k-th exact one, so ties do not matter
+    relevant = found = returned = 0
+    for procedure_id in sample:
+        expected = exact[procedure_id]
+        got = similar.get(procedure_id, ())
+        relevant += len(expected)
+        returned += len(got)
+        if expected:
+            threshold = expected[-1][1]
+            found += min(len(expected), sum(1 for _, score in got if score >= threshold))
+
+    print(f"Exact top {args.k} for {len(sample)} procedures in {exact_seconds:.2f}s "
+          f"(about {exact_seconds / max(len(sample), 1) * len(candidates):.1f}s for all of them)")
+    print(f"Recall@{args.k}: {found / relevant if relevant else 1:.3f}")
+    print(f"Results per procedure: {returned / max(len(sample), 1):.1f} (exact: {relevant / max(len(sample), 1):.1f})")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+import sys
+import time
+from pathlib import Path
+from owlready2 import World, sync_reasoner
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.rules import RuleEngine, facts_from_ontology, INFERRED_PROPERTIES
+
+# Compares the built-in rule engine against HermiT on the same ontology.
+ontology_uri = Path("ifixit_ontology.owl").resolve().as_uri()
+
+def property_triples(onto):
+    return {
+        (prop, subject.iri, obj.iri)
+        for prop in INFERRED_PROPERTIES
+        for subject, obj in getattr(onto, prop).get_relations()
+    }
+
+hermit_onto = World().get_ontology(ontology_uri).load()
+start = time.perf_counter()
+with hermit_onto:
+    sync_reasoner(hermit_onto.world, infer_property_values=True)
+print(f"HermiT: {time.perf_counter() - start:.2f}s")
+expected = property_triples(hermit_onto)
+
+rules_onto = World().get_ontology(ontology_uri).load()
+asserted = property_triples(rules_onto)
+start = time.perf_counter()
+inferred = RuleEngine().add(facts_from_ontology(rules_onto))
+print(f"Rule engine: {time.perf_counter() - start:.2f}s")
+actual = asserted | {(p, s, o) for s, p, o in inferred if p in INFERRED_PROPERTIES}
+
+missing = expected - actual
+extra = actual - expected
+print(f"{len(expected)} triples from HermiT, {len(actual)} from the rule engine")
+for prop, subject, obj in sorted(missing)[:20]:
+    print(f" - missing: {prop}({subject}, {obj})")
+for prop, subject, obj in sorted(extra)[:20]:
+    print(f" + extra: {prop}({subject}, {obj})")
+sys.exit(1 if missing or extra else 0)
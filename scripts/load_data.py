@@ -1,182 +1,561 @@
+import argparse
+import glob
+import hashlib
 import json
-from owlready2 import *
 import os
+import sys
+import time
+from collections import defaultdict, deque
+from itertools import chain
+from multiprocessing import Pool
+from owlready2 import *
 from pathlib import Path
 from tqdm import tqdm
 
-ontology_path = Path("ifixit_ontology.owl").resolve()
-print("Ontology absolute path:", ontology_path)
-
-if not ontology_path.is_file():
-    print("Ontology file not found at:", ontology_path)
-    exit(1)
-
-ontology_uri = ontology_path.as_uri()
-print("Ontology URI:", ontology_uri)
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.snapshot import file_hash, update_snapshot
 
-onto = get_ontology(ontology_uri).load(only_local=True, reload=True)
+ONTOLOGY_FILE = "ifixit_ontology.owl"
+STORE_FILE = "ifixit_load.sqlite3"
+CHECKPOINT_FILE = "ifixit_load.checkpoint.json"
+JOURNAL_FILE = "ifixit_load.journal.jsonl"
+FINGERPRINT_FILE = "ifixit_ontology.fingerprints.json"
+SNAPSHOT_FILE = "ifixit_ontology.sqlite3"
 
-print("Verifying 'url' property:")
-url_property = onto.search_one(iri="*url")
-if url_property:
-    is_functional = FunctionalProperty in url_property.is_a
-    print(f"'url' is {'functional' if is_functional else 'non-functional'}")
-else:
-    print("'url' property not found in the ontology.")
-    
 def sanitise_id(s):
     if s:
         return s.replace('"', '').replace("'", '').replace(" ", "_").replace("&", "and").replace("<", "").replace(">", "").replace("/", "_")
     return s
 
-with open("data/Mac.json", 'r') as f:
-    data = [json.loads(line) for line in f]
+# --- Pipeline stages: read -> parse -> normalize -------------------------------
+
+def read_lines(path, offset=0, end=None):
+    """Yield (offset after line, raw line) from a JSONL file, from byte `offset` up to `end`."""
+    with open(path, 'rb') as f:
+        f.seek(offset)
+        for line in f:
+            offset += len(line)
+            yield offset, line
+            if end is not None and offset >= end:
+                break
+
+def parse(lines):
+    for offset, line in lines:
+        line = line.strip()
+        if line:
+            yield offset, json.loads(line), hashlib.sha256(line).hexdigest()
+
+def normalize_manual(manual):
+    """Reduce a raw iFixit manual to the sanitised ids and values the loader needs."""
+    categories = [
+        (sanitise_id(name), name) for name in reversed(manual["Ancestors"]) if name
+    ]
+    toolbox = []
+    for tool_data in manual["Toolbox"]:
+        if not tool_data["Name"]:
+            continue
+        tool_name = tool_data["Name"].strip().lower()
+        toolbox.append((sanitise_id(tool_name), tool_name, tool_data["Url"], tool_data["Thumbnail"]))
+
+    steps = []
+    for step_data in manual["Steps"]:
+        tools = []
+        for tool_name in step_data.get("Tools_annotated", []):
+            if tool_name and tool_name != "NA":
+                tool_name = tool_name.strip().lower()
+                tools.append((sanitise_id(tool_name), tool_name))
+        steps.append({
+            'id': f"Step_{step_data['StepId']}",
+            'order': step_data["Order"],
+            'stepid': step_data["StepId"],
+            'description': step_data["Text_raw"],
+            'actions': [
+                (sanitise_id(action["name"]).strip("_").lower(), action["name"])
+                for action in step_data.get("Removal_verbs", []) if action.get("name")
+            ],
+            'parts': [(sanitise_id(name), name) for name in step_data.get("Word_level_parts_clean", []) if name],
+            'tools': tools,
+            'images': [
+                (sanitise_id(url.split('/')[-1].split('.')[0]), url)
+                for url in step_data.get("Images", []) if url
+            ],
+        })
+
+    return {
+        'id': f"Procedure_{manual['Guidid']}",
+        'guidid': manual["Guidid"],
+        'title': manual["Title"],
+        'url': manual["Url"],
+        'categories': categories,
+        'item': (sanitise_id(manual["Category"]), manual["Category"]),
+        'toolbox': toolbox,
+        'steps': steps,
+    }
+
+def normalize(manuals):
+    for offset, manual, fingerprint in manuals:
+        record = normalize_manual(manual)
+        record['fingerprint'] = fingerprint
+        yield offset, record
+
+def split_chunks(path, offset, chunk_size):
+    """Split a file from `offset` into (path, start, end) byte ranges that end on line boundaries."""
+    size = os.path.getsize(path)
+    with open(path, 'rb') as f:
+        while offset < size:
+            f.seek(min(offset + chunk_size, size))
+            f.readline()
+            end = min(f.tell(), size)
+            yield path, offset, end
+            offset = end
+
+def load_chunk(chunk):
+    """Parse and normalize one byte range; runs in a worker process."""
+    path, start, end = chunk
+    return chunk, list(normalize(parse(read_lines(path, start, end))))
+
+def ordered_map(pool, func, items, window):
+    """Like pool.imap, but keeps at most `window` results in flight so memory stays bounded."""
+    pending = deque()
+    for item in items:
+        pending.append(pool.apply_async(func, (item,)))
+        if len(pending) >= window:
+            yield pending.popleft().get()
+    while pending:
+        yield pending.popleft().get()
+
+# --- Emit: write normalized records into the ontology --------------------------
+
+class OntologyLoader:
+    def __init__(self, onto, verbose=True):
+        self.onto = onto
+        self.verbose = verbose
+        # Every entity in the ontology by name, so lookups are a dict access rather than
+        # an onto.search_one(iri="*" + name) query against the quadstore.
+        self.entities = {entity.name: entity for entity in chain(onto.classes(), onto.properties(), onto.individuals())}
+        self.created_count = 0
+        # Object property values are collected here and written once per (entity, property)
+        # on flush, instead of one quadstore update per appended value.
+        self.pending_links = defaultdict(list)
+        self.seen_links = {}
+        # Entities created or given new property values, and IRIs of destroyed ones,
+        # so the rule engine can be told exactly what changed (see replay)
+        self.touched = {}
+        self.retracted = []
+
+    def lookup(self, name):
+        return self.entities.get(name)
+
+    def create(self, cls, name):
+        entity = cls(name)
+        self.entities[name] = entity
+        self.touched[name] = entity
+        self.created_count += 1
+        return entity
+
+    def link(self, subject, prop, value):
+        key = (subject, prop)
+        seen = self.seen_links.get(key)
+        if seen is None:
+            seen = self.seen_links[key] = set(getattr(subject, prop))
+        if value not in seen:
+            seen.add(value)
+            self.pending_links[key].append(value)
+            self.touched[subject.name] = subject
+
+    def flush(self):
+        for (subject, prop), values in self.pending_links.items():
+            getattr(subject, prop).extend(values)
+        self.pending_links.clear()
+        self.seen_links.clear()
+
+    def retract(self, procedure_id):
+        """Remove a procedure and the steps that belong only to it."""
+        procedure = self.lookup(procedure_id)
+        if not procedure:
+            return
+        self.flush()
+        for step in list(procedure.consists_of):
+            if all(other == procedure for other in self.onto.search(consists_of=step)):
+                self.forget(step)
+        self.forget(procedure)
+
+    def forget(self, entity):
+        del self.entities[entity.name]
+        self.touched.pop(entity.name, None)
+        self.retracted.append(entity.iri)
+        destroy_entity(entity)
+
+    def load(self, record):
+        onto = self.onto
 
-with onto:
-    # Wrap the data loop with tqdm
-    for manual in tqdm(data, desc="Processing manuals"):
         # Create DeviceCategory instances
         categories = []
         previous_category = None
-        for category_name in reversed(manual["Ancestors"]):
-            if not category_name:
-                continue  # Skip if category_name is None or empty
-            category_id = sanitise_id(category_name)
-            category = onto.search_one(iri="*" + category_id)
+        for category_id, category_name in record['categories']:
+            category = self.lookup(category_id)
             if not category:
-                category = onto.DeviceCategory(category_id)
+                category = self.create(onto.DeviceCategory, category_id)
                 category.title = category_name
                 if previous_category:
-                    category.subcategory_of.append(previous_category)
+                    self.link(category, "subcategory_of", previous_category)
             categories.append(category)
             previous_category = category
 
         # Create Item instance
-        item_id = sanitise_id(manual["Category"])
-        item = onto.search_one(iri="*" + item_id)
+        item_id, item_title = record['item']
+        item = self.lookup(item_id)
         if not item:
-            item = onto.Item(item_id)
-            item.title = manual["Category"]
+            item = self.create(onto.Item, item_id)
+            item.title = item_title
             item.belongs_to_category = [categories[-1]]
-            item.url = manual["Url"]
+            item.url = record['url']
             # Establish subclass_of relationships based on categories
             if len(categories) > 1:
                 # The immediate parent category
                 parent_category = categories[-2]
                 # Find or create parent item
                 parent_item_id = parent_category.name
-                parent_item = onto.search_one(iri="*" + parent_item_id)
+                parent_item = self.lookup(parent_item_id)
                 if not parent_item:
-                    parent_item = onto.Item(parent_item_id)
+                    parent_item = self.create(onto.Item, parent_item_id)
                     parent_item.title = parent_category.title
                 # Establish subclass_of relationship
-                item.subclass_of.append(parent_item)
+                self.link(item, "subclass_of", parent_item)
 
         # Create Procedure instance
-        procedure_id = f"Procedure_{manual['Guidid']}"
-        procedure = onto.search_one(iri="*" + procedure_id)
+        procedure = self.lookup(record['id'])
         if not procedure:
-            procedure = onto.Procedure(procedure_id)
-            procedure.title = manual["Title"]
-            procedure.url = manual["Url"]
-            procedure.guidid = manual["Guidid"]
+            procedure = self.create(onto.Procedure, record['id'])
+            procedure.title = record['title']
+            procedure.url = record['url']
+            procedure.guidid = record['guidid']
             procedure.part_of = [item]
 
         # Create Tool instances and associate with procedure
         tools = []
-        for tool_data in manual["Toolbox"]:
-            tool_name = tool_data["Name"]
-            if not tool_name:
-                continue  # Skip if tool_name is None or empty
-            tool_name = tool_name.strip().lower()
-            tool_name_clean = sanitise_id(tool_name)
-            tool = onto.search_one(iri="*" + tool_name_clean)
+        for tool_id, tool_name, tool_url, tool_thumbnail in record['toolbox']:
+            tool = self.lookup(tool_id)
             if not tool:
-                tool = onto.Tool(tool_name_clean)
+                tool = self.create(onto.Tool, tool_id)
                 tool.title = tool_name
-                tool.url = tool_data["Url"]
-                tool.thumbnail = tool_data["Thumbnail"]
+                tool.url = tool_url
+                tool.thumbnail = tool_thumbnail
             tools.append(tool)
-        procedure.uses_tool = tools
 
         # Create Step instances and associate with procedure
-        steps = []
         # Collect tools used in steps to check later
         tools_used_in_steps = set()
-        for step_data in tqdm(manual["Steps"], desc="Processing steps", leave=False):
-            step_id = f"Step_{step_data['StepId']}"
-            step = onto.search_one(iri="*" + step_id)
+        for step_record in record['steps']:
+            step = self.lookup(step_record['id'])
             if not step:
-                step = onto.Step(step_id)
-                step.order = step_data["Order"]
-                step.stepid = step_data["StepId"]
-                step.description = step_data["Text_raw"]
-        
+                step = self.create(onto.Step, step_record['id'])
+                step.order = step_record['order']
+                step.stepid = step_record['stepid']
+                step.description = step_record['description']
+
             # Ensure the step is associated with the procedure
-            if step not in procedure.consists_of:
-                procedure.consists_of.append(step)
-        
+            self.link(procedure, "consists_of", step)
+
             # Create Action instances and associate with step
-            for action_data in step_data.get("Removal_verbs", []):
-                action_name = action_data.get("name")
-                if not action_name:
-                    continue  # Skip if action_name is None or empty
-                action_name_clean = sanitise_id(action_name).strip("_").lower()
-                action = onto.search_one(iri="*" + action_name_clean)
+            for action_id, action_name in step_record['actions']:
+                action = self.lookup(action_id)
                 if not action:
-                    action = onto.Action(action_name_clean)
+                    action = self.create(onto.Action, action_id)
                     action.title = action_name
+                self.link(step, "action", action)
 
-                if action not in step.action:
-                    step.action.append(action)
-        
             # Create Part instances and associate with step
-            for part_name in step_data.get("Word_level_parts_clean", []):
-                if not part_name:
-                    continue  # Skip if part_name is None or empty
-                part_id = sanitise_id(part_name)
-                part = onto.search_one(iri="*" + part_id)
+            for part_id, part_name in step_record['parts']:
+                part = self.lookup(part_id)
                 if not part:
-                    part = onto.Part(part_id)
+                    part = self.create(onto.Part, part_id)
                     part.title = part_name
-                step.involves_part.append(part)
+                self.link(step, "involves_part", part)
                 # Establish part_of relationship between Part and Item
-                if item is not None and part is not None:
-                    part.part_of.append(item)
-        
+                self.link(part, "part_of", item)
+
             # Associate tools with step
-            for tool_name in step_data.get("Tools_annotated", []):
-                if tool_name and tool_name != "NA":
-                    tool_name = tool_name.strip().lower()
-                    tool_name_clean = sanitise_id(tool_name)
-                    tool = onto.search_one(iri="*" + tool_name_clean)
-                    if not tool:
-                        tool = onto.Tool(tool_name_clean)
-                        tool.title = tool_name
-                    step.uses_tool.append(tool)
-                    tools_used_in_steps.add(tool)
-        
+            for tool_id, tool_name in step_record['tools']:
+                tool = self.lookup(tool_id)
+                if not tool:
+                    tool = self.create(onto.Tool, tool_id)
+                    tool.title = tool_name
+                self.link(step, "uses_tool", tool)
+                tools_used_in_steps.add(tool)
+
             # Associate images with step
-            for image_url in step_data.get("Images", []):
-                if not image_url:
-                    continue  # Skip if image_url is None or empty
-                image_id = sanitise_id(image_url.split('/')[-1].split('.')[0])
-                image = onto.search_one(iri="*" + image_id)
+            for image_id, image_url in step_record['images']:
+                image = self.lookup(image_id)
                 if not image:
-                    image = onto.Image(image_id)
+                    image = self.create(onto.Image, image_id)
                     image.url = image_url
-                step.image.append(image)
-
+                self.link(step, "image", image)
 
         # After processing steps, check if all tools used in steps are in the procedure's toolbox
-        tools_in_toolbox = set(procedure.uses_tool)
-        missing_tools = tools_used_in_steps - tools_in_toolbox
-        if missing_tools:
-            print(f"\nWarning: Procedure '{procedure.title}' (ID: {procedure_id}) is missing the following tools in its toolbox:")
+        missing_tools = tools_used_in_steps - set(tools)
+        if missing_tools and self.verbose:
+            tqdm.write(f"Warning: Procedure '{procedure.title}' (ID: {record['id']}) is missing the following tools in its toolbox:")
             for tool in missing_tools:
-                print(f" - Tool: {tool.title} (ID: {tool.name})")
-            # Automatically add missing tools to procedure's toolbox
-            procedure.uses_tool.extend(missing_tools)
+                tqdm.write(f" - Tool: {tool.title} (ID: {tool.name})")
+        # Automatically add missing tools to procedure's toolbox
+        tools.extend(missing_tools)
+        procedure.uses_tool = tools
+        self.touched[procedure.name] = procedure
+
+# --- Fingerprints and checkpointing -----------------------------------------
+
+def read_fingerprints():
+    """Guidid -> content hash of every manual already in the ontology."""
+    try:
+        with open(FINGERPRINT_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return {}
+
+def write_fingerprints(fingerprints):
+    with open(f"{FINGERPRINT_FILE}.tmp", 'w') as f:
+        json.dump(fingerprints, f)
+    os.replace(f"{FINGERPRINT_FILE}.tmp", FINGERPRINT_FILE)
+
+def open_journal(offset=None):
+    """Open the run's journal for appending: an append-only JSONL log with one entry per
+    manual seen ("seen", guidid, fingerprint), guide pruned ("prune", guidid) and, with
+    --incremental, retraction ("retract", procedure id) and load ("load", record).
+
+    The checkpoint only records how long the journal was at the last commit. When
+    resuming, `offset` is that length and anything written after it is dropped, as the
+    quadstore changes it describes were not committed either.
+    """
+    if offset is None:
+        return open(JOURNAL_FILE, 'wb')
+    journal = open(JOURNAL_FILE, 'r+b')
+    journal.truncate(offset)
+    journal.seek(offset)
+    return journal
+
+def write_entry(journal, *entry):
+    journal.write(json.dumps(entry).encode() + b'\n')
+
+def read_journal():
+    for _, line in read_lines(JOURNAL_FILE):
+        yield json.loads(line)
+
+def journal_changes():
+    """The retractions and loads in the journal, in order, read lazily."""
+    for entry in read_journal():
+        if entry[0] in ('retract', 'load'):
+            yield entry[0], entry[1]
+
+def replay(onto, changes):
+    """Apply the same retractions and loads to another copy of the ontology.
+
+    Returns the IRIs of the entities destroyed and the entities created or changed, for update_snapshot.
+    """
+    loader = OntologyLoader(onto, verbose=False)
+    with onto:
+        for action, value in changes:
+            if action == 'retract':
+                loader.retract(value)
+            else:
+                loader.load(value)
+        loader.flush()
+    return loader.retracted, list(loader.touched.values())
+
+def read_checkpoint():
+    try:
+        with open(CHECKPOINT_FILE) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+def write_checkpoint(checkpoint):
+    with open(f"{CHECKPOINT_FILE}.tmp", 'w') as f:
+        json.dump(checkpoint, f)
+    os.replace(f"{CHECKPOINT_FILE}.tmp", CHECKPOINT_FILE)
+
+def open_ontology(checkpoint):
+    """Load the ontology into an on-disk quadstore so progress survives a crash.
+
+    With a checkpoint, the partially loaded quadstore from the interrupted run is reopened instead.
+    """
+    ontology_path = Path(ONTOLOGY_FILE).resolve()
+    print("Ontology absolute path:", ontology_path)
+    if not ontology_path.is_file():
+        print("Ontology file not found at:", ontology_path)
+        exit(1)
+    ontology_uri = ontology_path.as_uri()
+    print("Ontology URI:", ontology_uri)
+
+    if not checkpoint and os.path.exists(STORE_FILE):
+        os.remove(STORE_FILE)
+    default_world.set_backend(filename=STORE_FILE)
+    if checkpoint:
+        return default_world.get_ontology(checkpoint['base_iri'])
+    return get_ontology(ontology_uri).load(only_local=True, reload=True)
+
+def expand_inputs(patterns):
+    """Absolute input paths in order, without duplicates. A pattern matching nothing is kept as
+    given, so main() can report it as missing."""
+    paths = []
+    for pattern in patterns:
+        matches = sorted(glob.glob(pattern)) or [pattern]
+        paths.extend(os.path.abspath(path) for path in matches if os.path.abspath(path) not in paths)
+    return paths
+
+def main():
+    parser = argparse.ArgumentParser(description="Load iFixit JSONL manuals into the ontology.")
+    parser.add_argument("inputs", nargs="*", default=["data/Mac.json"], help="JSONL files or glob patterns")
+    parser.add_argument("--jobs", type=int, default=os.cpu_count(), help="worker processes for parsing")
+    parser.add_argument("--chunk-size", type=int, default=8 << 20, help="bytes of input per work unit")
+    parser.add_argument("--commit-every", type=int, default=500, help="manuals between quadstore commits")
+    parser.add_argument("--restart", action="store_true", help="ignore any checkpoint from an interrupted run")
+    parser.add_argument("--incremental", action="store_true", help="only apply manuals whose content changed since the last load")
+    parser.add_argument("--prune", action="store_true", help="with --incremental, retract guides missing from the inputs")
+    args = parser.parse_args()
+    inputs = expand_inputs(args.inputs)
+    missing = [path for path in inputs if not os.path.isfile(path)]
+    if missing:
+        parser.error(f"no such input file(s): {', '.join(missing)}")
+
+    checkpoint = None if args.restart else read_checkpoint()
+    if checkpoint and checkpoint['inputs'] != inputs:
+        print(f"Ignoring checkpoint for {checkpoint['inputs']}.")
+        checkpoint = None
+    if checkpoint and ('journal' not in checkpoint or not os.path.exists(JOURNAL_FILE)):
+        print("Ignoring checkpoint without a journal.")
+        checkpoint = None
+    # Wall time of each phase, printed at the end. With --incremental the ontology is still
+    # parsed and saved whole, and these show how much of the run that takes.
+    timings = []
+    phase_start = time.perf_counter()
+    onto = open_ontology(checkpoint)
+    timings.append(("open ontology", time.perf_counter() - phase_start))
+    # The OWL file is only rewritten at the end of a run, so this is its hash before the run even when resuming
+    previous_hash = file_hash(ONTOLOGY_FILE)
+    file_index, offset = checkpoint['position'] if checkpoint else (0, 0)
+    manuals_done = checkpoint['manuals'] if checkpoint else 0
+    # Manuals loaded again and procedures retracted, for the summary
+    counts = checkpoint['counts'] if checkpoint else {'loaded': 0, 'retracted': 0}
+    # Fingerprints of the manuals loaded so far, written next to the OWL file when it is saved,
+    # and the guides seen in the inputs, for --prune. What this run did to them is in the journal.
+    fingerprints = read_fingerprints()
+    seen_guides = set()
+    journal = open_journal(checkpoint['journal'] if checkpoint else None)
+    if checkpoint:
+        print(f"Resuming after {manuals_done} manuals ({inputs[file_index]}, byte {offset}).")
+        for entry in read_journal():
+            if entry[0] == 'seen':
+                seen_guides.add(entry[1])
+                fingerprints[entry[1]] = entry[2]
+            elif entry[0] == 'prune':
+                fingerprints.pop(entry[1], None)
+
+    print("Verifying 'url' property:")
+    url_property = onto.url
+    if url_property:
+        is_functional = FunctionalProperty in url_property.is_a
+        print(f"'url' is {'functional' if is_functional else 'non-functional'}")
+    else:
+        print("'url' property not found in the ontology.")
+
+    # Chunks are parsed and normalized in parallel, then merged into the ontology
+    # in input order so the result does not depend on scheduling.
+    def chunks():
+        for i in range(file_index, len(inputs)):
+            yield from split_chunks(inputs[i], offset if i == file_index else 0, args.chunk_size)
+
+    loader = OntologyLoader(onto)
+    start = time.perf_counter()
+    total_bytes = sum(os.path.getsize(path) for path in inputs)
+    done_bytes = sum(os.path.getsize(path) for path in inputs[:file_index]) + offset
+    progress = tqdm(total=total_bytes, initial=done_bytes, unit="B", unit_scale=True, desc="Processing manuals")
+    position = [file_index, offset]
+
+    def commit():
+        loader.flush()
+        default_world.save()
+        journal.flush()
+        os.fsync(journal.fileno())
+        write_checkpoint({
+            'inputs': inputs,
+            'base_iri': onto.base_iri,
+            'position': position,
+            'manuals': manuals_done,
+            'counts': counts,
+            'journal': journal.tell(),
+        })
+
+    pool = Pool(args.jobs) if args.jobs > 1 else None
+    results = ordered_map(pool, load_chunk, chunks(), args.jobs * 2) if pool else map(load_chunk, chunks())
+    with onto:
+        for (path, chunk_start, _), records in results:
+            position[:] = [inputs.index(path), chunk_start]
+            for end_offset, record in records:
+                guidid = str(record['guidid'])
+                seen_guides.add(guidid)
+                write_entry(journal, 'seen', guidid, record['fingerprint'])
+                if args.incremental:
+                    if fingerprints.get(guidid) == record['fingerprint']:
+                        record = None  # unchanged since the last load
+                    elif guidid in fingerprints:
+                        loader.retract(record['id'])
+                        write_entry(journal, 'retract', record['id'])
+                        counts['retracted'] += 1
+                if record:
+                    loader.load(record)
+                    fingerprints[guidid] = record['fingerprint']
+                    if args.incremental:
+                        write_entry(journal, 'load', record)
+                        counts['loaded'] += 1
+                progress.update(end_offset - position[1])
+                position[1] = end_offset
+                manuals_done += 1
+                if manuals_done % args.commit_every == 0:
+                    commit()
+        progress.close()
+        if pool:
+            pool.close()
+
+        if args.incremental and args.prune:
+            for guidid in set(fingerprints) - seen_guides:
+                loader.retract(f"Procedure_{guidid}")
+                write_entry(journal, 'prune', guidid)
+                write_entry(journal, 'retract', f"Procedure_{guidid}")
+                counts['retracted'] += 1
+                del fingerprints[guidid]
+        commit()
+        journal.close()
+
+        elapsed = time.perf_counter() - start
+        timings.append(("load manuals", elapsed))
+        if args.incremental:
+            print(f"{counts['loaded']} of {len(seen_guides)} manuals changed, {counts['retracted']} procedures retracted")
+        print(f"Created {loader.created_count} entities from {len(inputs)} file(s) in {elapsed:.1f}s ({loader.created_count / max(elapsed, 1e-9):.0f} entities/sec)")
+
+        # Save the updated ontology
+        phase_start = time.perf_counter()
+        onto.save(file=ONTOLOGY_FILE, format="rdfxml")
+        write_fingerprints(fingerprints)
+        timings.append(("save ontology", time.perf_counter() - phase_start))
+
+    default_world.close()
+    os.remove(CHECKPOINT_FILE)
+    os.remove(STORE_FILE)
+
+    # Bring the reasoned snapshot up to date without re-materializing everything,
+    # streaming the changes from the journal rather than holding them in memory
+    if args.incremental:
+        phase_start = time.perf_counter()
+        updated = update_snapshot(ONTOLOGY_FILE, SNAPSHOT_FILE, previous_hash, lambda snapshot: replay(snapshot, journal_changes()))
+        timings.append(("update snapshot", time.perf_counter() - phase_start))
+        if updated:
+            print(f"Applied {counts['loaded'] + counts['retracted']} changes to '{SNAPSHOT_FILE}'.")
+        else:
+            print(f"'{SNAPSHOT_FILE}' was not built from the previous ontology; run scripts/materialize.py.")
+    os.remove(JOURNAL_FILE)
+
+    print("Timing: " + ", ".join(f"{name} {seconds:.1f}s" for name, seconds in timings))
 
-    # Save the updated ontology
-    onto.save(file="ifixit_ontology.owl", format="rdfxml")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
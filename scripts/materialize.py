@@ -0,0 +1,17 @@
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.snapshot import materialize, is_fresh
+
+ontology_path = "ifixit_ontology.owl"
+snapshot_path = "ifixit_ontology.sqlite3"
+
+if is_fresh(ontology_path, snapshot_path) and "--force" not in sys.argv:
+    print(f"Snapshot '{snapshot_path}' is up to date with '{ontology_path}'.")
+    sys.exit(0)
+
+start = time.perf_counter()
+materialize(ontology_path, snapshot_path, use_hermit="--hermit" in sys.argv)
+print(f"Materialized '{ontology_path}' into '{snapshot_path}' in {time.perf_counter() - start:.1f}s.")
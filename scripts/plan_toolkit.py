@@ -0,0 +1,67 @@
+import argparse
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.snapshot import load_store
+from ontology.toolkit import plan_toolkit
+
+ONTOLOGY_FILE = "ifixit_ontology.owl"
+SNAPSHOT_FILE = "ifixit_ontology.sqlite3"
+
+def read_guidids(args):
+    guidids = list(args.guidids)
+    if args.file:
+        with (sys.stdin if args.file == "-" else open(args.file)) as f:
+            guidids.extend(int(word) for line in f for word in line.replace(",", " ").split())
+    return guidids
+
+def main():
+    parser = argparse.ArgumentParser(description="Work out which tools to bring for a queue of guides.")
+    parser.add_argument("guidids", nargs="*", type=int, help="guide ids to plan for")
+    parser.add_argument("--file", metavar="FILE", help="also read guide ids from FILE (whitespace or comma separated, - for stdin)")
+    parser.add_argument("--max-tools", type=int, help="only plan guides that can be completed with at most this many tools")
+    parser.add_argument("--timing", action="store_true", help="report how long loading and planning took")
+    args = parser.parse_args()
+
+    guidids = read_guidids(args)
+    if not guidids:
+        parser.error("no guide ids given")
+
+    start = time.perf_counter()
+    store = load_store(ONTOLOGY_FILE, SNAPSHOT_FILE)
+    load_seconds = time.perf_counter() - start
+
+    unknown = [guidid for guidid in guidids if guidid not in store.by_guidid]
+    procedure_ids = [store.by_guidid[guidid] for guidid in guidids if guidid in store.by_guidid]
+
+    start = time.perf_counter()
+    plan = plan_toolkit(store.tool_bits, procedure_ids, args.max_tools)
+    plan_seconds = time.perf_counter() - start
+
+    if unknown:
+        print(f"Unknown guide ids: {', '.join(map(str, unknown))}")
+
+    print(f"Toolkit for {len(set(procedure_ids))} guides ({len(plan['toolkit'])} tools):")
+    for tool_id, count in plan["toolkit"]:
+        print(f"- {store.tools[tool_id].title} (needed by {count} guides)")
+
+    print("\nPacking plan:")
+    kit_size = completed_total = 0
+    for tool_ids, completed in plan["steps"]:
+        kit_size += len(tool_ids)
+        completed_total += len(completed)
+        added = ", ".join(store.tools[tool_id].title for tool_id in tool_ids) or "no tools needed"
+        print(f"- {added}: {kit_size} tools complete {completed_total} guides (+{len(completed)})")
+
+    if plan["incomplete"]:
+        print(f"\n{len(plan['incomplete'])} guides cannot be completed within {args.max_tools} tools:")
+        for procedure_id in plan["incomplete"]:
+            print(f"- {store.procedures[procedure_id].title} ({store.procedures[procedure_id].guidid})")
+
+    if args.timing:
+        print(f"\nLoaded the store in {load_seconds * 1000:.1f} ms, planned in {plan_seconds * 1000:.1f} ms.")
+
+if __name__ == "__main__":
+    main()
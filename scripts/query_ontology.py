@@ -1,19 +1,21 @@
-from owlready2 import *
-from rdflib import Graph, Namespace
-from rdflib.namespace import RDF, RDFS, OWL, XSD
+import argparse
+import sys
+import time
+from pathlib import Path
 
-onto = get_ontology("ifixit_ontology.owl").load()
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+from ontology.snapshot import load_reasoned, load_store
+from ontology.hazards import load_matcher
 
-# Export ontology to an RDFLib graph
-graph = onto.world.as_rdflib_graph()
+ONTOLOGY_FILE = "ifixit_ontology.owl"
+SNAPSHOT_FILE = "ifixit_ontology.sqlite3"
+TURTLE_FILE = "ifixit_knowledge_graph.ttl"
 
-ifixit_ns = Namespace("http://example.org/ifixit.owl#")
-graph.bind("ifixit", ifixit_ns)
-graph.serialize(destination="ifixit_knowledge_graph.ttl", format="turtle")
+# Queries run on owlready2's own SPARQL engine, which compiles them to SQL over
+# the snapshot's quadstore. ??1 marks a parameter bound when the query runs.
 
-# Query 1: Procedures with more than 6 steps
-query1 = """
-PREFIX ifixit: <http://example.org/ifixit.owl#>
+# Query 1: Procedures with more than N steps
+STEP_COUNTS = """
 SELECT ?procedure ?title (COUNT(?step) AS ?num_steps)
 WHERE {
   ?procedure rdf:type ifixit:Procedure .
@@ -21,22 +23,11 @@ WHERE {
   ?procedure ifixit:title ?title .
 }
 GROUP BY ?procedure ?title
-HAVING (COUNT(?step) > 6)
+HAVING (COUNT(?step) > ??1)
 """
 
-print("Procedures with more than 6 steps:")
-results1 = graph.query(query1)
-for row in results1:
-    procedure_iri = row.procedure
-    title = row.title
-    num_steps = row.num_steps
-    print(f"- {title} ({procedure_iri}) has {num_steps} steps")
-
-print("\n" + "="*50 + "\n")
-
-# Query 2: Items with more than 10 procedures
-query2 = """
-PREFIX ifixit: <http://example.org/ifixit.owl#>
+# Query 2: Items with more than N procedures
+PROCEDURE_COUNTS = """
 SELECT ?item ?title (COUNT(?procedure) AS ?num_procedures)
 WHERE {
   ?procedure rdf:type ifixit:Procedure .
@@ -44,22 +35,11 @@ WHERE {
   ?item ifixit:title ?title .
 }
 GROUP BY ?item ?title
-HAVING (COUNT(?procedure) > 10)
+HAVING (COUNT(?procedure) > ??1)
 """
 
-print("Items with more than 10 procedures:")
-results2 = graph.query(query2)
-for row in results2:
-    item_iri = row.item
-    title = row.title
-    num_procedures = row.num_procedures
-    print(f"- {title} ({item_iri}) has {num_procedures} procedures")
-
-print("\n" + "="*50 + "\n")
-
 # Query 3: Procedures with tools not used in steps
-query3 = """
-PREFIX ifixit: <http://example.org/ifixit.owl#>
+UNUSED_TOOLS = """
 SELECT DISTINCT ?procedure ?title ?tool_title
 WHERE {
   ?procedure rdf:type ifixit:Procedure .
@@ -73,36 +53,147 @@ WHERE {
 }
 """
 
-print("Procedures with tools not used in steps:")
-results3 = graph.query(query3)
-for row in results3:
-    procedure_iri = row.procedure
-    procedure_title = row.title
-    tool_title = row.tool_title
-    print(f"- Procedure '{procedure_title}' ({procedure_iri}) includes tool '{tool_title}' not used in any step")
-
-print("\n" + "="*50 + "\n")
-
-# Query 4: Steps with potential hazards
-query4 = """
-PREFIX ifixit: <http://example.org/ifixit.owl#>
-SELECT ?procedure ?proc_title ?step ?step_order ?description
+# Query 4: Step descriptions, which are then tagged with the hazard lexicon in
+# one pass each instead of a regex FILTER per keyword
+STEP_DESCRIPTIONS = """
+SELECT ?procedure ?title ?order ?description
 WHERE {
   ?procedure rdf:type ifixit:Procedure .
+  ?procedure ifixit:title ?title .
   ?procedure ifixit:consists_of ?step .
-  ?procedure ifixit:title ?proc_title .
-  ?step ifixit:order ?step_order .
+  ?step ifixit:order ?order .
   ?step ifixit:description ?description .
-  FILTER (regex(?description, "careful|dangerous", "i"))
 }
-ORDER BY ?procedure ?step_order
+ORDER BY ?procedure ?order
 """
 
-print("Steps with potential hazards (containing 'careful' or 'dangerous'):")
-results4 = graph.query(query4)
-for row in results4:
-    procedure_title = row.proc_title
-    step_order = row.step_order
-    description = row.description
-    print(f"- Procedure '{procedure_title}', Step {step_order}: {description}")
+def prepare(world, base_iri, query):
+    return world.prepare_sparql(f"PREFIX ifixit: <{base_iri}>\n{query}")
+
+def run(timings, name, prepared, params=()):
+    """Execute a prepared query and record its wall time and row count."""
+    return timed(timings, name, lambda: list(prepared.execute(list(params))))
+
+def timed(timings, name, compute):
+    start = time.perf_counter()
+    rows = compute()
+    timings.append((name, time.perf_counter() - start, len(rows)))
+    return rows
+
+def export_turtle(onto, path):
+    # rdflib is only needed for this export
+    from rdflib import Namespace
+    graph = onto.world.as_rdflib_graph()
+    graph.bind("ifixit", Namespace(onto.base_iri))
+    graph.serialize(destination=path, format="turtle")
+
+SEPARATOR = "\n" + "="*50 + "\n"
+
+def sparql_reports(onto, args, timings):
+    """The four reports, queried from the reasoned snapshot."""
+    world = onto.world
+
+    print(f"Procedures with more than {args.min_steps} steps:")
+    for procedure, title, num_steps in run(timings, "step counts", prepare(world, onto.base_iri, STEP_COUNTS), [args.min_steps]):
+        print(f"- {title} ({procedure.iri}) has {num_steps} steps")
+
+    print(SEPARATOR)
+
+    print(f"Items with more than {args.min_procedures} procedures:")
+    for item, title, num_procedures in run(timings, "procedure counts", prepare(world, onto.base_iri, PROCEDURE_COUNTS), [args.min_procedures]):
+        print(f"- {title} ({item.iri}) has {num_procedures} procedures")
+
+    print(SEPARATOR)
+
+    print("Procedures with tools not used in steps:")
+    for procedure, title, tool_title in run(timings, "unused tools", prepare(world, onto.base_iri, UNUSED_TOOLS)):
+        print(f"- Procedure '{title}' ({procedure.iri}) includes tool '{tool_title}' not used in any step")
+
+    print(SEPARATOR)
+
+    hazards = load_matcher()
+    print("Steps with potential hazards:")
+    rows = run(timings, "step descriptions", prepare(world, onto.base_iri, STEP_DESCRIPTIONS))
+    start = time.perf_counter()
+    tagged = 0
+    for procedure, title, order, description in rows:
+        tags = hazards.tags(description)
+        if tags:
+            tagged += 1
+            print(f"- Procedure '{title}', Step {order} [{', '.join(tags)}]: {description}")
+    timings.append(("hazard tagging", time.perf_counter() - start, tagged))
+
+def table_reports(store, args, timings):
+    """The four reports, read from the tables materialized with the store (ontology/reports.py)."""
+    reports = store.reports
+
+    print(f"Procedures with more than {args.min_steps} steps:")
+    for num_steps, procedure_id in timed(timings, "step counts", lambda: reports.procedures_with_more_steps(args.min_steps)):
+        procedure = store.procedures[procedure_id]
+        print(f"- {procedure.title} ({procedure.url}) has {num_steps} steps")
+
+    print(SEPARATOR)
+
+    print(f"Items with more than {args.min_procedures} procedures:")
+    for num_procedures, item_id in timed(timings, "procedure counts", lambda: reports.items_with_more_procedures(args.min_procedures)):
+        item = store.items[item_id]
+        print(f"- {item.title} ({item.url}) has {num_procedures} procedures")
+
+    print(SEPARATOR)
+
+    print("Procedures with tools not used in steps:")
+    unused = timed(timings, "unused tools", lambda: [
+        (store.procedures[procedure_id], store.tools[tool_id])
+        for procedure_id, tool_ids in sorted(reports.unused_tools.items()) for tool_id in tool_ids
+    ])
+    for procedure, tool in unused:
+        print(f"- Procedure '{procedure.title}' ({procedure.url}) includes tool '{tool.title}' not used in any step")
+
+    print(SEPARATOR)
+
+    print("Steps with potential hazards:")
+    hazardous = timed(timings, "hazard steps", lambda: [
+        (store.procedures[procedure_id], number, store.steps[step_id])
+        for procedure_id, steps in sorted(reports.hazard_steps.items()) for number, step_id in steps
+    ])
+    for procedure, number, step in hazardous:
+        print(f"- Procedure '{procedure.title}', Step {number} [{', '.join(step.hazards)}]: {step.description}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the example report queries against the reasoned iFixit ontology.")
+    parser.add_argument("--min-steps", type=int, default=6, help="query 1: list procedures with more steps than this")
+    parser.add_argument("--min-procedures", type=int, default=10, help="query 2: list items with more procedures than this")
+    parser.add_argument("--sparql", action="store_true", help="run the SPARQL queries on the snapshot instead of reading the precomputed tables")
+    parser.add_argument("--turtle", nargs="?", const=TURTLE_FILE, metavar="FILE", help=f"also export the knowledge graph as Turtle (default file: {TURTLE_FILE})")
+    parser.add_argument("--timing", action="store_true", help="report the wall time and row count of each query")
+    args = parser.parse_args()
+
+    timings = []
+    onto = None
+    if args.sparql or args.turtle:
+        start = time.perf_counter()
+        onto = load_reasoned(ONTOLOGY_FILE, SNAPSHOT_FILE)
+        timings.append(("open snapshot", time.perf_counter() - start, None))
+
+    if args.turtle:
+        start = time.perf_counter()
+        export_turtle(onto, args.turtle)
+        timings.append((f"export {args.turtle}", time.perf_counter() - start, None))
+
+    if args.sparql:
+        sparql_reports(onto, args, timings)
+    else:
+        start = time.perf_counter()
+        store = load_store(ONTOLOGY_FILE, SNAPSHOT_FILE)
+        timings.append(("open store", time.perf_counter() - start, None))
+        table_reports(store, args, timings)
+
+    if args.timing:
+        print(SEPARATOR)
+        print("Timing:")
+        for name, seconds, count in timings:
+            rows_note = f", {count} rows" if count is not None else ""
+            print(f"- {name}: {seconds * 1000:.1f} ms{rows_note}")
 
+if __name__ == "__main__":
+    main()